@@ -0,0 +1,73 @@
+"""
+Benchmark of the JSON backends on synthetic availability and location payloads.
+
+usage: python benchmarks/bench_json_parse.py [n_items]
+
+The peak memory includes the parsed rows, which are the same for every backend.
+"""
+import io
+import json
+import sys
+import time
+import tracemalloc
+
+from hkvwaporpy import json_parse
+
+
+class _Response(object):
+    """minimal stand-in for requests.Response holding a body in memory"""
+    def __init__(self, content):
+        self.content = content
+        self.raw = io.BytesIO(content)
+
+
+def availability_payload(n_items):
+    items = []
+    for i in range(n_items):
+        year = 2009 + i // 36
+        month = 1 + (i % 36) // 3
+        items.append([
+            {'value': '{0}-{1:02d}-D1 | 01 to 10'.format(year, month)},
+            {'value': 1.0, 'metadata': {
+                'raster': {'id': 'L2_AETI_{0}{1:02d}'.format(year % 100, i % 36),
+                           'bbox': [{'srid': 'EPSG:4326', 'value': [-180.0, -90.0, 180.0, 90.0]}],
+                           'width': 1000, 'height': 1000, 'noDataValue': -9999,
+                           'dataType': 'INT16', 'compression': 'LZW'},
+                'operations': [{'code': 'DOWNLOAD', 'caption': 'Download'}] * 4,
+                'additionalInfo': {'description': 'x' * 400}}}])
+    return json.dumps({'response': {'items': items}}).encode()
+
+
+def locations_payload(n_items):
+    rows = [{'name': 'location {}'.format(i), 'code': 'LOC{}'.format(i), 'type': 'BASIN',
+             'bbox': '-10.0,-10.0,10.0,10.0', 'l1': True, 'l2': True, 'l3': False,
+             'geometry': 'x' * 2000} for i in range(n_items)]
+    return json.dumps({'response': rows}).encode()
+
+
+def bench(payload, prefix, extract, backend):
+    # time and memory are measured in separate passes, tracemalloc slows down parsing
+    time_start = time.perf_counter()
+    rows = list(extract(json_parse.iter_items(_Response(payload), prefix, backend)))
+    elapsed = time.perf_counter() - time_start
+
+    tracemalloc.start()
+    list(extract(json_parse.iter_items(_Response(payload), prefix, backend)))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(rows), elapsed, peak
+
+
+if __name__ == '__main__':
+    n_items = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    payloads = [
+        ('availability', availability_payload(n_items), 'response.items.item',
+         lambda items: json_parse.iter_availability(items, 1)),
+        ('locations', locations_payload(n_items), 'response.item', json_parse.iter_locations),
+    ]
+    print('{0:<14}{1:<8}{2:>10}{3:>12}{4:>14}'.format('payload', 'backend', 'rows', 'time [s]', 'peak [MiB]'))
+    for name, payload, prefix, extract in payloads:
+        for backend in json_parse.available_backends():
+            n_rows, elapsed, peak = bench(payload, prefix, extract, backend)
+            print('{0:<14}{1:<8}{2:>10}{3:>12.3f}{4:>14.1f}'.format(
+                name, backend, n_rows, elapsed, peak / 2 ** 20))
@@ -1,4 +1,14 @@
 from hkvwaporpy.fao_wapor_api import __fao_wapor_class
+from hkvwaporpy.cube_info import CubeInfo
+from hkvwaporpy.pipeline import BulkPipeline
+from hkvwaporpy.journal import JobJournal
+from hkvwaporpy.snapshot import export_snapshot, load_snapshot
+from hkvwaporpy.sharding import HashShard, LeaseShard
+from hkvwaporpy.aggregate import aggregate_dekads
+from hkvwaporpy.timeseries import TimeSeriesStore
+from hkvwaporpy.prefetch import Prefetcher
+from hkvwaporpy.availability import get_multi_availability, availability_matrix
+from hkvwaporpy.profiling import Profiler
 
 __doc__ = """package for FAO WAPOR API"""
 __version__ = "0.7.2"
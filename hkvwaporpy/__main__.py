@@ -0,0 +1,5 @@
+import sys
+
+from hkvwaporpy.cli import main
+
+sys.exit(main())
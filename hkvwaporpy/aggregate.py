@@ -0,0 +1,281 @@
+import calendar
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+SEASONS = {'DJF': [12, 1, 2], 'MAM': [3, 4, 5], 'JJA': [6, 7, 8], 'SON': [9, 10, 11]}
+
+
+def _import_gdal():
+    try:
+        from osgeo import gdal
+    except ImportError:
+        try:
+            import gdal
+        except ImportError:
+            raise ImportError('aggregating rasters requires GDAL (https://gdal.org)')
+    gdal.UseExceptions()
+    return gdal
+
+
+def dekad_days(year, start_dekad):
+    """
+    number of days in a dekad. The first and second dekad of a month contain 10 days,
+    the third dekad contains the remaining 8 to 11 days of the month.
+
+    Parameters
+    ----------
+    year : int or str
+        year of the dekad
+    start_dekad : str
+        start of the dekad as 'mmdd' (column start_dekad of get_data_availability())
+
+    Returns
+    -------
+    n_days : int
+    """
+    month = int(start_dekad[:2])
+    day = int(start_dekad[2:4])
+    if day < 21:
+        return 10
+    return calendar.monthrange(int(year), month)[1] - 20
+
+
+def plan_aggregation(df_avail, period='month', seasons=SEASONS):
+    """
+    group the dekads of an availability frame into output periods
+
+    Parameters
+    ----------
+    df_avail : pd.DataFrame
+        availability frame of a dekadal cube as returned by get_data_availability(),
+        with year as index and the columns start_dekad, end_dekad and raster_id
+    period : str
+        'month', 'season' or 'year'
+    seasons : dict
+        season names with their months, used for period 'season'. A season that
+        contains December and January is assigned to the year of January
+
+    Returns
+    -------
+    df_plan : pd.DataFrame
+        the dekads with the columns year, month, n_days, period, period_days (calendar
+        length of the period) and complete (True if all days of the period are available)
+    """
+    df = df_avail.reset_index()
+    df['year'] = df['year'].astype(int)
+    df['month'] = df['start_dekad'].str[:2].astype(int)
+    df['n_days'] = [dekad_days(year, start) for year, start in zip(df['year'], df['start_dekad'])]
+
+    if period == 'month':
+        df['period'] = ['{0}-{1:02d}'.format(y, m) for y, m in zip(df['year'], df['month'])]
+        df['period_days'] = [calendar.monthrange(y, m)[1] for y, m in zip(df['year'], df['month'])]
+    elif period == 'year':
+        df['period'] = df['year'].astype(str)
+        df['period_days'] = [366 if calendar.isleap(y) else 365 for y in df['year']]
+    elif period == 'season':
+        month_season = {}
+        for name, months in seasons.items():
+            for month in months:
+                month_season[month] = (name, 1 in months and month > months[-1])
+        labels = []
+        period_days = []
+        for year, month in zip(df['year'], df['month']):
+            name, next_year = month_season.get(month, (None, False))
+            if name is None:
+                labels.append(None)
+                period_days.append(0)
+                continue
+            label_year = year + 1 if next_year else year
+            labels.append('{0}-{1}'.format(label_year, name))
+            period_days.append(sum(
+                calendar.monthrange(label_year - 1 if month_season[m][1] else label_year, m)[1]
+                for m in seasons[name]))
+        df['period'] = labels
+        df['period_days'] = period_days
+        df = df[df['period'].notnull()].copy()
+    else:
+        raise ValueError('period {} unknown, choose from month, season or year'.format(period))
+    df['complete'] = df.groupby('period')['n_days'].transform('sum') == df['period_days']
+    return df
+
+
+# datasets opened by the worker processes, kept open between blocks
+_datasets = {}
+
+
+def _read_block(filename, window):
+    gdal = _import_gdal()
+    if filename not in _datasets:
+        _datasets[filename] = gdal.Open(filename)
+    return _read_window(_datasets[filename], window)
+
+
+def _read_window(ds, window):
+    """
+    read a window of the first band of an opened dataset, with scale and offset applied
+
+    Returns
+    -------
+    data : np.ndarray
+        float32 values of the window
+    valid : np.ndarray
+        False where the raster is nodata
+    """
+    band = ds.GetRasterBand(1)
+    xoff, yoff, xsize, ysize = window
+    data = band.ReadAsArray(xoff, yoff, xsize, ysize).astype(np.float32)
+    nodata = band.GetNoDataValue()
+    valid = np.ones(data.shape, dtype=bool) if nodata is None else data != nodata
+    scale = band.GetScale() or 1.
+    offset = band.GetOffset() or 0.
+    if scale != 1. or offset != 0.:
+        data *= scale
+        data += offset
+    return data, valid
+
+
+def _aggregate_block(filenames, days, window, statistic, skipna):
+    """
+    aggregate one block of all input rasters of a period, one raster at a time
+    """
+    total = None
+    for filename, n_days in zip(filenames, days):
+        data, valid = _read_block(filename, window)
+        if total is None:
+            total = np.zeros(data.shape, dtype=np.float64)
+            valid_days = np.zeros(data.shape, dtype=np.int32)
+            missing = np.zeros(data.shape, dtype=bool)
+        np.add(total, data * n_days, out=total, where=valid)
+        valid_days += valid * n_days
+        missing |= ~valid
+
+    if statistic == 'mean':
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = total / valid_days
+    else:
+        result = total
+    nodata_mask = valid_days == 0
+    if not skipna:
+        nodata_mask |= missing
+    return window, result.astype(np.float32), nodata_mask
+
+
+def aggregate_dekads(df_avail, raster_folder, output_folder, period='month', statistic='sum',
+                     skipna=False, seasons=SEASONS, block_size=512, n_workers=None,
+                     nodata=-9999., require_complete=True):
+    """
+    aggregate downloaded dekadal rasters into monthly, seasonal or annual rasters.
+
+    The dekadal values are rates per day. Every dekad is weighted with its number of
+    days, so 'sum' gives the total over the period and 'mean' the average daily rate.
+    The rasters are processed in blocks of block_size x block_size pixels, reading one
+    input block at a time, so memory use does not depend on the raster size or the
+    number of dekads. Blocks are processed in parallel by n_workers processes.
+
+    Parameters
+    ----------
+    df_avail : pd.DataFrame
+        availability frame of a dekadal cube as returned by get_data_availability()
+    raster_folder : str
+        folder containing the downloaded rasters as {raster_id}.tif, not used for
+        rows with a 'filename' column
+    output_folder : str
+        folder for the aggregated rasters, written as {period}.tif
+    period : str
+        'month', 'season' or 'year'
+    statistic : str
+        'sum' (day weighted total) or 'mean' (day weighted mean)
+    skipna : boolean
+        if False, a pixel that is nodata in any of the dekads of a period is nodata in
+        the result. If True, only the valid dekads are used
+    seasons : dict
+        season names with their months, used for period 'season'
+    block_size : int
+        size of the blocks in pixels
+    n_workers : int or None
+        number of processes, defaults to the number of cores
+    nodata : float
+        nodata value of the output rasters
+    require_complete : boolean
+        if True, periods for which not all dekads are available (e.g. the current month
+        or a season at the start of the time range) are skipped. If False they are
+        aggregated over the available dekads and flagged in the complete column
+
+    Returns
+    -------
+    df_periods : pd.DataFrame
+        one row per output period with the number of dekads, number of days, calendar
+        length of the period, complete and filename
+    """
+    if statistic not in ['sum', 'mean']:
+        raise ValueError('statistic {} unknown, choose from sum or mean'.format(statistic))
+    gdal = _import_gdal()
+    os.makedirs(output_folder, exist_ok=True)
+
+    df_plan = plan_aggregation(df_avail, period=period, seasons=seasons)
+    if require_complete and not df_plan['complete'].all():
+        incomplete = sorted(df_plan.loc[~df_plan['complete'], 'period'].unique())
+        print('Skipping incomplete periods: {}'.format(', '.join(incomplete)))
+        df_plan = df_plan[df_plan['complete']]
+    if 'filename' not in df_plan.columns:
+        df_plan['filename'] = [os.path.join(raster_folder, '{}.tif'.format(raster_id))
+                               for raster_id in df_plan['raster_id']]
+
+    records = []
+    with ProcessPoolExecutor(max_workers=n_workers or os.cpu_count()) as executor:
+        for period_label, df_period in df_plan.groupby('period', sort=True):
+            filenames = df_period['filename'].tolist()
+            days = df_period['n_days'].tolist()
+            out_file = os.path.join(output_folder, '{}.tif'.format(period_label))
+
+            # all inputs must share the grid of the first raster
+            ds_first = gdal.Open(filenames[0])
+            xsize, ysize = ds_first.RasterXSize, ds_first.RasterYSize
+            for filename in filenames[1:]:
+                ds = gdal.Open(filename)
+                if (ds.RasterXSize, ds.RasterYSize) != (xsize, ysize):
+                    raise ValueError('{0} does not have the grid of {1}'.format(filename, filenames[0]))
+                ds = None
+
+            driver = gdal.GetDriverByName('GTiff')
+            ds_out = driver.Create(out_file, xsize, ysize, 1, gdal.GDT_Float32, options=[
+                'TILED=YES', 'COMPRESS=DEFLATE', 'BLOCKXSIZE=256', 'BLOCKYSIZE=256', 'BIGTIFF=IF_SAFER'])
+            ds_out.SetGeoTransform(ds_first.GetGeoTransform())
+            ds_out.SetProjection(ds_first.GetProjection())
+            band_out = ds_out.GetRasterBand(1)
+            band_out.SetNoDataValue(nodata)
+            ds_first = None
+
+            windows = [(xoff, yoff, min(block_size, xsize - xoff), min(block_size, ysize - yoff))
+                       for yoff in range(0, ysize, block_size)
+                       for xoff in range(0, xsize, block_size)]
+
+            # keep a bounded number of blocks in flight
+            max_pending = 2 * (n_workers or os.cpu_count())
+            pending = []
+            for window in windows:
+                pending.append(executor.submit(
+                    _aggregate_block, filenames, days, window, statistic, skipna))
+                if len(pending) >= max_pending:
+                    _write_block(band_out, pending.pop(0).result(), nodata)
+            for future in pending:
+                _write_block(band_out, future.result(), nodata)
+
+            band_out.FlushCache()
+            ds_out = None
+            records.append({'period': period_label, 'n_dekads': len(filenames),
+                            'n_days': int(sum(days)),
+                            'period_days': int(df_period['period_days'].iloc[0]),
+                            'complete': bool(df_period['complete'].iloc[0]), 'filename': out_file})
+
+    columns = ['period', 'n_dekads', 'n_days', 'period_days', 'complete', 'filename']
+    return pd.DataFrame(records, columns=columns).set_index('period')
+
+
+def _write_block(band, block, nodata):
+    (xoff, yoff, _, _), result, nodata_mask = block
+    result[nodata_mask] = nodata
+    band.WriteArray(result, xoff, yoff)
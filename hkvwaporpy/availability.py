@@ -0,0 +1,155 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from hkvwaporpy.timeseries import period_labels
+
+
+def select_cubes(client, catalog_filter):
+    """
+    select cube codes from the catalogus
+
+    Parameters
+    ----------
+    client : __fao_wapor_class
+        client with the catalogus loaded (see get_catalogus())
+    catalog_filter : str or callable
+        regular expression matched against the cube codes (eg. '^L2_.*_D$'), or a
+        function that takes the catalogus dataframe and returns a boolean Series
+
+    Returns
+    -------
+    cube_codes : list
+    """
+    df = client._catalogus
+    if callable(catalog_filter):
+        mask = catalog_filter(df)
+    else:
+        mask = df['code'].str.contains(re.compile(catalog_filter))
+    return df.loc[mask, 'code'].tolist()
+
+
+def _intersects(bbox_a, bbox_b):
+    # bounding boxes as [xmin, ymin, xmax, ymax]
+    return bbox_a[0] <= bbox_b[2] and bbox_b[0] <= bbox_a[2] and bbox_a[1] <= bbox_b[3] and bbox_b[1] <= bbox_a[3]
+
+
+def _location_bboxes(client, locations):
+    """
+    bounding box of each (loc_type, loc_code) from get_locations()
+    """
+    df_locations = client.get_locations()
+    bboxes = {}
+    for loc_type, loc_code in locations:
+        df = df_locations[(df_locations['type'] == loc_type) & (df_locations['code'] == loc_code)]
+        if df.empty:
+            raise ValueError('location {0} {1} unknown, see get_locations()'.format(loc_type, loc_code))
+        bboxes[(loc_type, loc_code)] = df['bbox'].iloc[0]
+    return bboxes
+
+
+def get_multi_availability(client, cube_codes=None, catalog_filter=None,
+                           time_range='[2014-11-01,2016-01-01]', locations=None, n_workers=8):
+    """
+    data availability of several cubes and locations, queried concurrently
+
+    Parameters
+    ----------
+    client : __fao_wapor_class
+        client with the catalogus loaded (see get_catalogus())
+    cube_codes : list or None
+        codes of the cubes of interest
+    catalog_filter : str, callable or None
+        select the cubes from the catalogus instead, see select_cubes()
+    time_range : str
+        time range as used in get_data_availability()
+    locations : list or None
+        list of (loc_type, loc_code) tuples (eg. [('BASIN', 'ZAM')]). The availability
+        of a cube is queried once, a raster is available for a location if its bounding
+        box intersects the bounding box of the location (from get_locations()). Rasters
+        with a bounding box in another reference system than EPSG:4326 are kept for
+        every location. By default the availability is not split by location
+    n_workers : int
+        number of concurrent requests
+
+    Returns
+    -------
+    df_long : pd.DataFrame
+        one row per cube, location and period with the columns cube_code, loc_type,
+        loc_code, period, raster_id, bbox_srid and bbox_value (loc_type and loc_code
+        are None without locations). Cubes for which the request failed are left out
+        and listed in df_long.attrs['failed'], a dataframe with the columns cube_code
+        and error, so a failed request can be told apart from a cube without data
+    """
+    if cube_codes is None:
+        if catalog_filter is None:
+            raise ValueError('specify cube_codes or catalog_filter')
+        cube_codes = select_cubes(client, catalog_filter)
+    bboxes = _location_bboxes(client, locations) if locations else {(None, None): None}
+
+    def query(cube_code):
+        try:
+            cube_info = client.get_cube_info(cube_code=cube_code)
+            df_avail = client.get_data_availability(cube_info, time_range=time_range)
+            df = pd.DataFrame({
+                'cube_code': cube_code,
+                'period': period_labels(df_avail),
+                'raster_id': df_avail['raster_id'].values,
+                'bbox_srid': df_avail['bbox_srid'].values,
+                'bbox_value': df_avail['bbox_value'].values,
+            })
+            frames = []
+            for (loc_type, loc_code), loc_bbox in bboxes.items():
+                df_loc = df.assign(loc_type=loc_type, loc_code=loc_code)
+                if loc_bbox is not None:
+                    mask = [str(srid) not in ['EPSG:4326', '4326'] or _intersects(bbox, loc_bbox)
+                            for srid, bbox in zip(df['bbox_srid'], df['bbox_value'])]
+                    df_loc = df_loc[mask]
+                frames.append(df_loc)
+            return cube_code, pd.concat(frames, ignore_index=True)
+        except Exception as e:
+            print('Availability failed for {0}: {1}'.format(cube_code, e))
+            return cube_code, repr(e)
+
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        results = list(executor.map(query, cube_codes))
+    frames = [result for _, result in results if isinstance(result, pd.DataFrame)]
+    failed = [(cube_code, result) for cube_code, result in results if not isinstance(result, pd.DataFrame)]
+
+    columns = ['cube_code', 'loc_type', 'loc_code', 'period', 'raster_id', 'bbox_srid', 'bbox_value']
+    if frames:
+        df_long = pd.concat(frames, ignore_index=True)
+        df_long = df_long[columns].sort_values(['cube_code', 'loc_code', 'period']).reset_index(drop=True)
+    else:
+        df_long = pd.DataFrame(columns=columns)
+    df_long.attrs['failed'] = pd.DataFrame(failed, columns=['cube_code', 'error'])
+    return df_long
+
+
+def availability_matrix(df_long, values=None):
+    """
+    pivot the output of get_multi_availability() to a period x cube_code matrix, or
+    a period x (cube_code, loc_code) matrix if the availability was split by location
+
+    Parameters
+    ----------
+    df_long : pd.DataFrame
+        output of get_multi_availability()
+    values : str or None
+        column to show in the cells (eg. 'raster_id'). By default the cells
+        are True where a raster is available and False otherwise
+
+    Returns
+    -------
+    df_matrix : pd.DataFrame
+        periods as index and cube codes (and location codes) as columns
+    """
+    columns = ['cube_code']
+    if 'loc_code' in df_long.columns and df_long['loc_code'].notnull().any():
+        columns.append('loc_code')
+    if values is None:
+        df_matrix = pd.crosstab(df_long['period'], [df_long[column] for column in columns]) > 0
+    else:
+        df_matrix = df_long.pivot_table(index='period', columns=columns, values=values, aggfunc='first')
+    return df_matrix.sort_index()
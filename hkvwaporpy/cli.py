@@ -0,0 +1,210 @@
+"""
+command-line entry point for bulk retrieval
+
+example:
+    hkvwaporpy fetch --version 2.0 --cube L2_AETI_D --loc-type BASIN --loc-code ZAM
+                     --range [2015-01-01,2016-01-01] --workers 16 --output data
+
+The API token is read from --token or from the environment variable WAPOR_API_TOKEN.
+Messages of the library are written to stderr, so stdout only carries the dry-run plan
+and the summary. With --summary - the plan is written to stderr as well.
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+
+def _build_parser():
+    parser = argparse.ArgumentParser(prog='hkvwaporpy', description='bulk retrieval of WaPOR rasters')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    fetch = subparsers.add_parser('fetch', help='query availability, resolve coverage URLs and download rasters')
+    fetch.add_argument('--version', dest='wapor_version', default='2.0', help='WaPOR version (default 2.0)')
+    fetch.add_argument('--cube', action='append', required=True, help='cube code, can be repeated')
+    fetch.add_argument('--loc-type', choices=['BASIN', 'COUNTRY'], help='location type for L2 cubes')
+    fetch.add_argument('--loc-code', action='append', default=[], help='location code for L2 cubes, can be repeated')
+    period = fetch.add_mutually_exclusive_group(required=True)
+    period.add_argument('--range', dest='time_range', help='time range, eg. [2015-01-01,2016-01-01]')
+    period.add_argument('--years', type=int, nargs='+', help='one or more years')
+    fetch.add_argument('--output', default='.', help='output folder (default current folder)')
+    fetch.add_argument('--token', default=os.environ.get('WAPOR_API_TOKEN'),
+                       help='WaPOR API token (default environment variable WAPOR_API_TOKEN)')
+    fetch.add_argument('--workers', type=int, default=8, help='number of concurrent resolves and downloads (default 8)')
+    fetch.add_argument('--queue-size', type=int, default=None, help='items waiting per stage (default 4 x workers)')
+    fetch.add_argument('--skip-existing', dest='skip_existing', action='store_true', default=True,
+                       help='do not download rasters that exist in the output folder (default)')
+    fetch.add_argument('--no-skip-existing', dest='skip_existing', action='store_false',
+                       help='download rasters again if they exist')
+    fetch.add_argument('--journal', help='SQLite journal file to resume interrupted runs')
+    fetch.add_argument('--snapshot', help='metadata snapshot to use instead of the catalog API')
+    fetch.add_argument('--dry-run', action='store_true', help='only print the plan, do not download')
+    fetch.add_argument('--summary', help='write a JSON summary to this file, - for stdout (the plan then goes to stderr)')
+    fetch.add_argument('--quiet', action='store_true', help='no progress output')
+    return parser
+
+
+class _Progress(object):
+    """
+    progress output on stderr, at most one line per interval seconds
+    """
+    def __init__(self, quiet=False, interval=1.):
+        self.quiet = quiet
+        self.interval = interval
+        self.n_done = 0
+        self.n_failed = 0
+        self.nbytes = 0
+        self._time_start = time.time()
+        self._time_last = 0.
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        with self._lock:
+            self.n_done += 1
+            self.nbytes += record['nbytes'] or 0
+            if record['status'] == 'failed':
+                self.n_failed += 1
+                if not self.quiet:
+                    sys.stderr.write('\nfailed {0} {1} {2} in {3}: {4}\n'.format(
+                        record['cube_code'], record['loc_code'] or '', record['raster_id'],
+                        record['stage'], record['error']))
+            now = time.time()
+            if not self.quiet and now - self._time_last >= self.interval:
+                self._time_last = now
+                self.write(now)
+
+    def write(self, now=None):
+        elapsed = (now or time.time()) - self._time_start
+        sys.stderr.write('\r{0} rasters ({1} failed), {2:.1f} MiB, {3:.1f} rasters/s, {4:.1f} MiB/s'.format(
+            self.n_done, self.n_failed, self.nbytes / 2 ** 20,
+            self.n_done / elapsed if elapsed else 0., self.nbytes / 2 ** 20 / elapsed if elapsed else 0.))
+        sys.stderr.flush()
+
+
+def _timings(values):
+    values = values.dropna()
+    if values.empty:
+        return None
+    return {'mean': float(values.mean()), 'p50': float(values.quantile(0.5)),
+            'p95': float(values.quantile(0.95)), 'max': float(values.max())}
+
+
+def _write_summary(summary, path, stdout):
+    text = json.dumps(summary, indent=2, default=str)
+    if path == '-':
+        stdout.write(text + '\n')
+    else:
+        with open(path, 'w') as f:
+            f.write(text)
+
+
+def fetch(args, stdout=None):
+    """
+    run the fetch command
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        parsed arguments of the fetch command
+    stdout : file or None
+        stream for the plan and the summary, by default sys.stdout. Everything the
+        library prints goes to stderr
+
+    Returns
+    -------
+    exit_code : int
+        0 if all rasters are available, 1 if any failed
+    """
+    stdout = stdout or sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        return _fetch(args, stdout)
+
+
+def _fetch(args, stdout):
+    import hkvwaporpy
+    from hkvwaporpy.journal import JobJournal
+    from hkvwaporpy.pipeline import BulkPipeline
+    from hkvwaporpy.snapshot import load_snapshot
+
+    if not args.dry_run and not args.token:
+        sys.stderr.write('an API token is required, use --token or set WAPOR_API_TOKEN\n')
+        return 2
+
+    client = load_snapshot(args.snapshot) if args.snapshot else hkvwaporpy.read_wapor
+    job_spec = {
+        'version': args.wapor_version,
+        'cube_codes': args.cube,
+        'locations': [(args.loc_type, loc_code) for loc_code in args.loc_code],
+    }
+    if args.years:
+        job_spec['years'] = args.years
+    else:
+        job_spec['time_range'] = args.time_range
+
+    progress = _Progress(quiet=args.quiet)
+    journal = JobJournal(args.journal) if args.journal and not args.dry_run else None
+    pipeline = BulkPipeline(
+        client, args.token, output_folder=args.output, n_availability=min(4, args.workers),
+        n_resolve=args.workers, n_download=args.workers,
+        queue_size=args.queue_size or 4 * args.workers, skip_existing=args.skip_existing,
+        journal=journal, progress=progress)
+
+    if args.dry_run:
+        time_start = time.time()
+        df_plan = pipeline.dry_run(job_spec)
+        plan_out = sys.stderr if args.summary == '-' else stdout
+        for row in df_plan.itertuples():
+            plan_out.write('{0}\t{1}\t{2}\t{3}\t{4}\n'.format(
+                row.cube_code, row.loc_code or '', row.raster_id, row.filename,
+                'exists' if row.exists else 'missing'))
+        summary = {
+            'dry_run': True,
+            'n_rasters': len(df_plan),
+            'n_existing': int(df_plan['exists'].sum()),
+            'n_missing': int((~df_plan['exists']).sum()),
+            'elapsed': time.time() - time_start,
+        }
+        if args.summary:
+            _write_summary(summary, args.summary, stdout)
+        return 0
+
+    df_report = pipeline.run(job_spec)
+    if not args.quiet:
+        progress.write()
+        sys.stderr.write('\n')
+
+    summary = dict(pipeline.summary)
+    summary['workers'] = args.workers
+    summary['time_resolve'] = _timings(df_report['time_resolve'])
+    summary['time_download'] = _timings(df_report['time_download'])
+    if journal is not None:
+        summary['journal'] = journal.progress()
+        journal.close()
+    if args.summary:
+        _write_summary(summary, args.summary, stdout)
+    return 1 if (df_report['status'] == 'failed').any() else 0
+
+
+def main(argv=None):
+    """
+    console entry point
+    """
+    parser = _build_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'fetch':
+        if args.loc_code and not args.loc_type:
+            parser.error('--loc-code requires --loc-type')
+        if args.loc_type and not args.loc_code:
+            parser.error('--loc-type requires at least one --loc-code')
+        level2 = [cube_code for cube_code in args.cube if cube_code.split('_')[0] == 'L2']
+        if level2 and not args.loc_code:
+            parser.error('--cube {} requires --loc-type and --loc-code'.format(level2[0]))
+        return fetch(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,192 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+class _Frozen(object):
+    """
+    comparison, hashing, repr and pickle support for frozen dataclasses with __slots__.
+    The attributes in _unhashed (raw API items) are not compared, hashed or shown.
+    """
+    __slots__ = ()
+    _unhashed = ()
+
+    def _key(self):
+        return tuple(getattr(self, name) for name in self.__slots__ if name not in self._unhashed)
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        return '{0}({1})'.format(type(self).__name__, ', '.join(
+            '{0}={1!r}'.format(name, getattr(self, name))
+            for name in self.__slots__ if name not in self._unhashed))
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            object.__setattr__(self, name, value)
+
+
+@dataclass(frozen=True, eq=False, repr=False)
+class DimensionMember(_Frozen):
+    __slots__ = ('code', 'caption')
+    code: str
+    caption: str
+
+
+@dataclass(frozen=True, eq=False, repr=False)
+class Dimension(_Frozen):
+    __slots__ = ('code', 'caption', 'type', 'workspace_code', 'members', 'raw')
+    _unhashed = ('raw',)
+    code: str
+    caption: str
+    type: str
+    workspace_code: str
+    members: tuple
+    raw: dict
+
+
+@dataclass(frozen=True, eq=False, repr=False)
+class Measure(_Frozen):
+    __slots__ = ('code', 'caption', 'unit', 'raw')
+    _unhashed = ('raw',)
+    code: str
+    caption: str
+    unit: str
+    raw: dict
+
+
+@dataclass(frozen=True, eq=False, repr=False)
+class CubeInfo(_Frozen):
+    """
+    metadata of a cube: its dimensions (with the members of SEASON and STAGE) and measures
+    """
+    __slots__ = ('code', 'version', 'workspace_code', 'dimensions', 'measures', 'additional_info')
+    _unhashed = ('additional_info',)
+    code: str
+    version: str
+    workspace_code: str
+    dimensions: tuple
+    measures: tuple
+    additional_info: dict
+
+    @classmethod
+    def from_items(cls, cube_code, version, additional_info, dimensions_items, measures_items, members_items):
+        """
+        build the model from the items of the catalog API
+
+        Parameters
+        ----------
+        cube_code : str
+            code of the cube
+        version : str
+            WaPOR version
+        additional_info : dict
+            additionalInfo of the cube from the catalogus
+        dimensions_items : list
+            items of the dimensions request
+        measures_items : list
+            items of the measures request
+        members_items : dict
+            dimension code as key and the items of the members request as value
+
+        Returns
+        -------
+        cube_info : CubeInfo
+        """
+        dimensions = tuple(
+            Dimension(
+                code=item['code'],
+                caption=item.get('caption'),
+                type=item.get('type'),
+                workspace_code=item.get('workspaceCode'),
+                members=tuple(DimensionMember(code=member['code'], caption=member.get('caption'))
+                              for member in members_items.get(item['code'], [])),
+                raw=item)
+            for item in dimensions_items)
+        measures = tuple(
+            Measure(code=item['code'], caption=item.get('caption'), unit=item.get('unit'), raw=item)
+            for item in measures_items)
+        workspace_code = dimensions[0].workspace_code if dimensions else None
+        return cls(code=cube_code, version=version, workspace_code=workspace_code,
+                   dimensions=dimensions, measures=measures, additional_info=dict(additional_info or {}))
+
+    @classmethod
+    def from_frame(cls, df_cube_info, version=None):
+        """
+        build the model from the dataframe returned by get_info_cube()
+        """
+        cube_code = df_cube_info.columns[0]
+        df_dims = df_cube_info.at['dimensions', cube_code]
+        df_meas = df_cube_info.at['measures', cube_code]
+        members_items = {}
+        dimensions_items = []
+        for code in df_dims.columns:
+            item = df_dims[code].drop(['season', 'stage', 'season_captions', 'stage_captions'],
+                                      errors='ignore').to_dict()
+            dimensions_items.append(item)
+            for row in ['season', 'stage']:
+                if row.upper() == code and row in df_dims.index:
+                    values = df_dims.at[row, code]
+                    if isinstance(values, (list, tuple, np.ndarray)):
+                        captions = df_dims.at[row + '_captions', code] \
+                            if row + '_captions' in df_dims.index else None
+                        if not isinstance(captions, (list, tuple, np.ndarray)):
+                            captions = [None] * len(values)
+                        members_items[code] = [{'code': value, 'caption': caption}
+                                               for value, caption in zip(values, captions)]
+        measures_items = [df_meas[code].to_dict() for code in df_meas.columns]
+        additional_info = df_cube_info[cube_code].drop(['dimensions', 'measures'], errors='ignore').to_dict()
+        return cls.from_items(cube_code, version, additional_info, dimensions_items, measures_items, members_items)
+
+    @property
+    def dimension_codes(self):
+        return tuple(dimension.code for dimension in self.dimensions)
+
+    @property
+    def time_dimension(self):
+        """
+        the time dimension of the cube, which is the last dimension
+        """
+        return self.dimensions[-1]
+
+    def get_dimension(self, code):
+        for dimension in self.dimensions:
+            if dimension.code == code:
+                return dimension
+        raise KeyError('dimension {0} not in cube {1}'.format(code, self.code))
+
+    def to_frame(self):
+        """
+        dataframe view as returned by get_info_cube(): the additional info of the cube with
+        the dimensions and measures as dataframes in the cells 'dimensions' and 'measures'.
+        The member codes of SEASON and STAGE are in the rows 'season' and 'stage', their
+        captions in 'season_captions' and 'stage_captions'
+        """
+        df_dimensions = pd.DataFrame.from_dict([dimension.raw for dimension in self.dimensions], orient='columns')
+        df_dimensions = df_dimensions.set_index('code', drop=False).T
+        for row in ['season', 'stage']:
+            df_dimensions.loc[row] = np.nan
+            df_dimensions.loc[row + '_captions'] = np.nan
+            if row.upper() in df_dimensions.columns:
+                members = self.get_dimension(row.upper()).members
+                df_dimensions.at[row, row.upper()] = [member.code for member in members]
+                df_dimensions.at[row + '_captions', row.upper()] = [member.caption for member in members]
+
+        df_measures = pd.DataFrame.from_dict([measure.raw for measure in self.measures], orient='columns')
+        df_measures = df_measures.set_index('code', drop=False).T
+
+        cells = dict(self.additional_info, dimensions=None, measures=None)
+        df_cube_info = pd.DataFrame({self.code: pd.Series(cells, dtype=object)})
+        df_cube_info.at['dimensions', self.code] = df_dimensions
+        df_cube_info.at['measures', self.code] = df_measures
+        return df_cube_info
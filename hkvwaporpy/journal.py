@@ -0,0 +1,270 @@
+import datetime
+import json
+import sqlite3
+import threading
+
+import pandas as pd
+
+# states of a planned raster
+PENDING = 'pending'
+URL_RESOLVED = 'url_resolved'
+DOWNLOADED = 'downloaded'
+FAILED = 'failed'
+
+# layout of the journal tables, increase when the layout changes
+JOURNAL_FORMAT = 2
+
+
+class JobJournal(object):
+    """
+    SQLite-backed journal of a bulk retrieval. It records every availability task and
+    every planned raster (version, cube_code, raster_id, location) with its state:
+
+        pending -> url_resolved -> downloaded
+                               \\-> failed
+
+    Every state change is committed immediately, so after a crash a new run with the
+    same journal file continues where the previous run stopped. Availability tasks
+    that were already planned are not queried again. A raster can belong to several
+    tasks (eg. a time range and the years within it), it has a single state.
+    """
+    def __init__(self, path):
+        """
+        Parameters
+        ----------
+        path : str
+            path of the SQLite database file, created if it does not exist
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        journal_format = self._conn.execute('PRAGMA user_version').fetchone()[0]
+        has_tables = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='rasters'").fetchone() is not None
+        if has_tables and journal_format != JOURNAL_FORMAT:
+            self._conn.close()
+            raise ValueError('journal {0} has format {1}, expected {2}. Start a new journal file'.format(
+                path, journal_format, JOURNAL_FORMAT))
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                version TEXT NOT NULL,
+                cube_code TEXT NOT NULL,
+                time_range TEXT NOT NULL,
+                planned_at TEXT NOT NULL,
+                PRIMARY KEY (version, cube_code, time_range)
+            );
+            CREATE TABLE IF NOT EXISTS rasters (
+                version TEXT NOT NULL,
+                cube_code TEXT NOT NULL,
+                raster_id TEXT NOT NULL,
+                loc_type TEXT NOT NULL,
+                loc_code TEXT NOT NULL,
+                year TEXT,
+                start_dekad TEXT,
+                end_dekad TEXT,
+                season TEXT,
+                stage TEXT,
+                bbox_srid TEXT,
+                bbox_value TEXT,
+                filename TEXT,
+                state TEXT NOT NULL,
+                download_url TEXT,
+                expiry_datetime TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (version, cube_code, raster_id, loc_type, loc_code)
+            );
+            CREATE TABLE IF NOT EXISTS task_rasters (
+                version TEXT NOT NULL,
+                cube_code TEXT NOT NULL,
+                time_range TEXT NOT NULL,
+                raster_id TEXT NOT NULL,
+                loc_type TEXT NOT NULL,
+                loc_code TEXT NOT NULL,
+                PRIMARY KEY (version, cube_code, time_range, raster_id, loc_type, loc_code)
+            );
+            CREATE INDEX IF NOT EXISTS rasters_state ON rasters (state);
+        """)
+        self._conn.execute('PRAGMA user_version={}'.format(JOURNAL_FORMAT))
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def is_planned(self, version, cube_code, time_range):
+        """
+        check if the availability of a task is already recorded in the journal
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT 1 FROM tasks WHERE version=? AND cube_code=? AND time_range=?',
+                (version, cube_code, time_range)).fetchone()
+        return row is not None
+
+    def add_availability(self, df_avail, version, cube_code, time_range, locations, filename=None):
+        """
+        record the rasters of an availability frame as pending for each location, link them
+        to the task and mark the task as planned. Rasters already in the journal keep their
+        state.
+
+        Parameters
+        ----------
+        df_avail : pd.DataFrame
+            availability frame as returned by get_data_availability()
+        version : str
+            WaPOR version
+        cube_code : str
+            code of the cube
+        time_range : str
+            time range used for get_data_availability()
+        locations : list
+            list of (loc_type, loc_code) tuples, [(None, None)] for L1 and L3 cubes
+        filename : callable or None
+            optional function that returns the local filename given a raster item
+        """
+        df = df_avail.reset_index()
+        index_name = df.columns[0]
+        now = datetime.datetime.now().isoformat()
+        rows = []
+        links = []
+        for rec in df.to_dict('records'):
+            if 'year' in rec:
+                year = rec['year']
+            else:
+                year = rec[index_name]
+            for loc_type, loc_code in locations:
+                item = {'version': version, 'cube_code': cube_code,
+                        'raster_id': rec['raster_id'], 'loc_type': loc_type, 'loc_code': loc_code}
+                rows.append((
+                    version, cube_code, rec['raster_id'], loc_type or '', loc_code or '',
+                    str(year), rec.get('start_dekad'), rec.get('end_dekad'),
+                    rec.get('season'), rec.get('stage'), rec.get('bbox_srid'),
+                    json.dumps(rec.get('bbox_value')),
+                    filename(item) if filename is not None else None,
+                    PENDING, now))
+                links.append((version, cube_code, time_range, rec['raster_id'], loc_type or '', loc_code or ''))
+        with self._lock:
+            self._conn.executemany("""
+                INSERT OR IGNORE INTO rasters (version, cube_code, raster_id, loc_type, loc_code,
+                    year, start_dekad, end_dekad, season, stage, bbox_srid,
+                    bbox_value, filename, state, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+            self._conn.executemany("""
+                INSERT OR IGNORE INTO task_rasters (version, cube_code, time_range, raster_id,
+                    loc_type, loc_code)
+                VALUES (?, ?, ?, ?, ?, ?)""", links)
+            self._conn.execute(
+                'INSERT OR REPLACE INTO tasks (version, cube_code, time_range, planned_at) VALUES (?, ?, ?, ?)',
+                (version, cube_code, time_range, now))
+            self._conn.commit()
+
+    def get_items(self, version=None, cube_code=None, time_range=None, states=(PENDING, URL_RESOLVED, FAILED)):
+        """
+        get the planned rasters, by default all rasters that are not yet downloaded
+
+        Parameters
+        ----------
+        version : str or None
+            only return rasters of this WaPOR version
+        cube_code : str or None
+            only return rasters of this cube
+        time_range : str or None
+            only return rasters planned by the task with this time range
+        states : list
+            states to return
+
+        Returns
+        -------
+        items : list
+            list of dicts, one per raster
+        """
+        query = 'SELECT r.* FROM rasters r WHERE r.state IN ({})'.format(','.join('?' * len(states)))
+        params = list(states)
+        if version is not None:
+            query += ' AND r.version=?'
+            params.append(version)
+        if cube_code is not None:
+            query += ' AND r.cube_code=?'
+            params.append(cube_code)
+        if time_range is not None:
+            query += """ AND EXISTS (SELECT 1 FROM task_rasters t
+                WHERE t.version=r.version AND t.cube_code=r.cube_code AND t.time_range=?
+                AND t.raster_id=r.raster_id AND t.loc_type=r.loc_type AND t.loc_code=r.loc_code)"""
+            params.append(time_range)
+        with self._lock:
+            cursor = self._conn.execute(query, params)
+            columns = [c[0] for c in cursor.description]
+            rows = cursor.fetchall()
+
+        items = []
+        for row in rows:
+            item = dict(zip(columns, row))
+            item['loc_type'] = item['loc_type'] or None
+            item['loc_code'] = item['loc_code'] or None
+            item['bbox_value'] = json.loads(item['bbox_value']) if item['bbox_value'] else None
+            if item['expiry_datetime']:
+                item['expiry_datetime'] = datetime.datetime.fromisoformat(item['expiry_datetime'])
+            items.append(item)
+        return items
+
+    def set_state(self, item, state, error=None):
+        """
+        update the state of a raster
+
+        Parameters
+        ----------
+        item : dict
+            raster item with at least version, cube_code, raster_id, loc_type and loc_code. For
+            state url_resolved the download_url and expiry_datetime are stored as well
+        state : str
+            one of 'pending', 'url_resolved', 'downloaded' or 'failed'
+        error : str or None
+            error message for state failed
+        """
+        expiry = item.get('expiry_datetime')
+        if isinstance(expiry, datetime.datetime):
+            expiry = expiry.isoformat()
+        with self._lock:
+            self._conn.execute("""
+                UPDATE rasters SET state=?, error=?, download_url=COALESCE(?, download_url),
+                    expiry_datetime=COALESCE(?, expiry_datetime), filename=COALESCE(?, filename),
+                    attempts=attempts + ?, updated_at=?
+                WHERE version=? AND cube_code=? AND raster_id=? AND loc_type=? AND loc_code=?""", (
+                state, error, item.get('download_url'), expiry, item.get('filename'),
+                1 if state == FAILED else 0, datetime.datetime.now().isoformat(), item['version'],
+                item['cube_code'], item['raster_id'], item['loc_type'] or '', item['loc_code'] or ''))
+            self._conn.commit()
+
+    def progress(self):
+        """
+        number of rasters per state
+
+        Returns
+        -------
+        progress : dict
+            dictionary with state as key and number of rasters as value
+        """
+        with self._lock:
+            rows = self._conn.execute('SELECT state, COUNT(*) FROM rasters GROUP BY state').fetchall()
+        progress = {PENDING: 0, URL_RESOLVED: 0, DOWNLOADED: 0, FAILED: 0}
+        progress.update(dict(rows))
+        return progress
+
+    def get_failed(self):
+        """
+        overview of the failed rasters
+
+        Returns
+        -------
+        df : pd.DataFrame
+            dataframe containing the failed rasters, their error and number of attempts
+        """
+        with self._lock:
+            df = pd.read_sql_query(
+                'SELECT version, cube_code, raster_id, loc_type, loc_code, error, attempts, updated_at '
+                'FROM rasters WHERE state=?', self._conn, params=(FAILED,))
+        return df
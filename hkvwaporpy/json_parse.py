@@ -0,0 +1,153 @@
+import io
+import json
+
+# optional faster decoder
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# optional incremental decoder
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+def available_backends():
+    """
+    list the JSON backends that can be used in this environment
+
+    Returns
+    -------
+    backends : list
+        subset of ['ijson', 'orjson', 'json']
+    """
+    backends = []
+    if ijson is not None:
+        backends.append('ijson')
+    if orjson is not None:
+        backends.append('orjson')
+    backends.append('json')
+    return backends
+
+
+def default_backend():
+    """
+    choose the JSON backend for large responses. Incremental parsing with ijson is
+    preferred when its C backend is installed, as only a single item is held in memory.
+    Otherwise the whole body is decoded with orjson, or with the standard json module.
+
+    Returns
+    -------
+    backend : str
+        'ijson', 'orjson' or 'json'
+    """
+    if ijson is not None and ijson.backend in ['yajl2_c', 'yajl2_cffi']:
+        return 'ijson'
+    if orjson is not None:
+        return 'orjson'
+    return 'json'
+
+
+def loads(content, backend=None):
+    """
+    decode a complete JSON document
+
+    Parameters
+    ----------
+    content : bytes or str
+        JSON document
+    backend : str or None
+        'orjson' or 'json', by default orjson if it is installed
+
+    Returns
+    -------
+    obj : dict or list
+        decoded object
+    """
+    if orjson is not None and backend in [None, 'orjson', 'ijson']:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def iter_items(resp, prefix, backend='json', buffered=False):
+    """
+    iterate over the elements of an array inside a JSON response
+
+    Parameters
+    ----------
+    resp : requests.Response
+        response, requested with stream=True for incremental parsing
+    prefix : str
+        ijson prefix of the array elements (eg. 'response.items.item')
+    backend : str
+        'ijson' parses the body incrementally from the stream,
+        'orjson' and 'json' decode the whole body first
+    buffered : boolean
+        the body was already read (eg. in profiling mode), ijson then parses
+        resp.content instead of the stream
+
+    Returns
+    -------
+    items : generator
+        elements of the array
+    """
+    if backend == 'ijson':
+        if buffered:
+            stream = io.BytesIO(resp.content)
+        else:
+            resp.raw.decode_content = True
+            stream = resp.raw
+        for item in ijson.items(stream, prefix, use_float=True):
+            yield item
+        return
+
+    obj = loads(resp.content, backend)
+    for key in prefix.split('.')[:-1]:
+        obj = obj[key]
+    for item in obj:
+        yield item
+
+
+def iter_availability(items, dimensions):
+    """
+    extract the fields used by get_data_availability() from the items of an
+    MDAQuery_Table response. The remaining metadata of each item is dropped directly.
+
+    Parameters
+    ----------
+    items : iterable
+        items of the response (see iter_items())
+    dimensions : int
+        number of dimensions of the cube
+
+    Returns
+    -------
+    rows : generator
+        tuples of (dimension_values, raster_id, bbox_srid, bbox_value)
+    """
+    for item in items:
+        values = [cell['value'] for cell in item[:dimensions]]
+        raster = item[dimensions]['metadata']['raster']
+        bbox = raster['bbox'][0]
+        yield values, raster['id'], bbox['srid'], bbox['value']
+
+
+def iter_locations(items):
+    """
+    extract the fields used by get_locations() from the rows of the LOCATION table
+
+    Parameters
+    ----------
+    items : iterable
+        rows of the response (see iter_items())
+
+    Returns
+    -------
+    rows : generator
+        tuples of (name, code, type, bbox, l1, l2, l3)
+    """
+    for loc in items:
+        yield (loc['name'], loc['code'], loc['type'], list(map(float, loc['bbox'].split(','))),
+               loc['l1'], loc['l2'], loc['l3'])
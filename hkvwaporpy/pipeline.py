@@ -0,0 +1,452 @@
+import datetime
+import os
+import queue
+import threading
+import time
+
+import pandas as pd
+
+from hkvwaporpy import journal as _journal
+
+
+class BulkPipeline(object):
+    """
+    Bulk retrieval of WaPOR rasters as a pipeline of concurrent stages:
+
+        availability -> coverage URL -> download -> process
+
+    Each stage runs in its own pool of worker threads and the stages are connected
+    by bounded queues. When a downstream stage is slower, the queue in front of it
+    fills up and the upstream workers block (backpressure), so the number of items
+    in flight never exceeds the sum of the queue sizes and the worker counts.
+    """
+    def __init__(self, client, APItoken, output_folder='.', n_availability=2, n_resolve=4,
+                 n_download=4, n_process=1, queue_size=64, process=None, skip_existing=True,
+                 journal=None, retry_failed=True, shard=None, progress=None):
+        """
+        Parameters
+        ----------
+        client : __fao_wapor_class
+            client to use, normally hkvwaporpy.read_wapor
+        APItoken : str
+            API token generated from the WaPOR portal
+        output_folder : str
+            folder in which rasters are stored as
+            {output_folder}/{cube_code}/{loc_code}/{raster_id}.tif
+        n_availability, n_resolve, n_download, n_process : int
+            number of worker threads for each stage
+        queue_size : int
+            maximum number of items waiting in front of each stage
+        process : callable or None
+            optional function called as process(item) for every downloaded raster,
+            its return value is stored in the 'result' column of the report
+        skip_existing : boolean
+            do not resolve and download rasters that already exist in output_folder
+        journal : JobJournal or None
+            journal to record the state of each raster. Tasks that are planned in the
+            journal are not queried again and only rasters that are not yet downloaded
+            are retrieved, so an interrupted run resumes where it stopped
+        retry_failed : boolean
+            when resuming from a journal, also retry rasters that failed before
+        shard : HashShard, LeaseShard or None
+            coordination between several nodes writing to the same (shared)
+            output_folder. Rasters claimed by another node get status 'other_node'
+            and are not resolved, downloaded or processed by this node. With a
+            LeaseShard these rasters are checked again at the end of the run, and
+            taken over when the other node released its lease without writing the
+            raster or stopped refreshing it
+        progress : callable or None
+            optional function called as progress(record) when a raster is finished,
+            record is a dict with the columns of the report
+        """
+        self.client = client
+        self.APItoken = APItoken
+        self.output_folder = output_folder
+        self.n_workers = {'availability': n_availability, 'resolve': n_resolve,
+                          'download': n_download, 'process': n_process}
+        self.queue_size = queue_size
+        self.process = process
+        self.skip_existing = skip_existing
+        self.journal = journal
+        self.retry_failed = retry_failed
+        self.shard = shard
+        self.progress = progress
+        self.summary = {}
+
+        self._records = []
+        self._deferred = []
+        self._time_start = None
+        self._lock = threading.Lock()
+
+    def plan(self, job_spec):
+        """
+        expand a job specification into availability tasks
+
+        Parameters
+        ----------
+        job_spec : dict or list of dicts
+            each dict contains the keys:
+            version : str
+                WaPOR version, '1.1' or '2.0' (default '2.0')
+            cube_codes : list
+                codes of the cubes of interest (eg. ['L2_AETI_D', 'L2_NPP_D'])
+            locations : list
+                list of (loc_type, loc_code) tuples, only used for L2 cubes
+            time_range : str
+                time range as used in get_data_availability() (eg. '[2015-01-01,2016-01-01]')
+            years : list
+                alternative for time_range, one availability task is created per year
+
+        Returns
+        -------
+        tasks : list
+            list of dicts with keys version, cube_code, time_range and locations
+        """
+        if isinstance(job_spec, dict):
+            job_spec = [job_spec]
+
+        tasks = []
+        for job in job_spec:
+            version = job.get('version', '2.0')
+            locations = [tuple(loc) for loc in job.get('locations', [])]
+            if 'years' in job:
+                time_ranges = ['[{0}-01-01,{0}-12-31]'.format(year) for year in job['years']]
+            else:
+                time_ranges = [job['time_range']]
+
+            for cube_code in job['cube_codes']:
+                if cube_code.split('_')[0] == 'L2':
+                    if not locations:
+                        print('For Level 2: Specify locations for {}'.format(cube_code))
+                        continue
+                    cube_locations = locations
+                else:
+                    cube_locations = [(None, None)]
+                for time_range in time_ranges:
+                    tasks.append({'version': version, 'cube_code': cube_code,
+                                  'time_range': time_range, 'locations': cube_locations})
+        return tasks
+
+    def raster_filename(self, item):
+        """
+        local filename of the raster described by item
+        """
+        loc_code = item['loc_code'] if item['loc_code'] is not None else item['cube_code'].split('_')[0]
+        return os.path.join(self.output_folder, item['cube_code'], loc_code,
+                            '{}.tif'.format(item['raster_id']))
+
+    def run(self, job_spec):
+        """
+        run the pipeline for a job specification, see plan() for the format
+
+        Returns
+        -------
+        df_report : pd.DataFrame
+            one row per raster with its status ('downloaded', 'existing', 'processed',
+            'other_node' or 'failed'), the stage in which it failed, the error and timings
+        """
+        tasks = self.plan(job_spec)
+        self._records = []
+        self._deferred = []
+        time_start = self._time_start = time.time()
+
+        # the client is set to one version at a time (get_cube_info and get_coverage_url
+        # use client.version), so the tasks of each version run as a separate batch
+        for version, version_tasks in self._group_by_version(tasks):
+            self._ensure_catalogus(version)
+            self._run_tasks(version_tasks)
+
+        df_report = pd.DataFrame(self._records, columns=[
+            'version', 'cube_code', 'loc_type', 'loc_code', 'raster_id', 'filename', 'status',
+            'stage', 'error', 'nbytes', 'time_resolve', 'time_download', 'result'])
+
+        elapsed = time.time() - time_start
+        nbytes = int(df_report['nbytes'].fillna(0).sum())
+        self.summary = {
+            'n_tasks': len(tasks),
+            'n_items': len(df_report),
+            'status': df_report['status'].value_counts().to_dict(),
+            'nbytes': nbytes,
+            'elapsed': elapsed,
+            'rasters_per_second': len(df_report) / elapsed if elapsed else 0.,
+            'bytes_per_second': nbytes / elapsed if elapsed else 0.,
+        }
+        return df_report
+
+    @staticmethod
+    def _group_by_version(tasks):
+        versions = sorted(set(task['version'] for task in tasks))
+        return [(version, [task for task in tasks if task['version'] == version]) for version in versions]
+
+    def _run_tasks(self, tasks):
+        """
+        run the stages for tasks of a single version, the client is set to that version
+        """
+        stages = [
+            ('availability', self._stage_availability),
+            ('resolve', self._stage_resolve),
+            ('download', self._stage_download),
+            ('process', self._stage_process),
+        ]
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in stages]
+        threads = []
+        for idx, (name, func) in enumerate(stages):
+            out_q = queues[idx + 1] if idx + 1 < len(queues) else None
+            stage_threads = []
+            for _ in range(max(1, self.n_workers[name])):
+                t = threading.Thread(target=self._worker, args=(name, func, queues[idx], out_q))
+                t.daemon = True
+                t.start()
+                stage_threads.append(t)
+            threads.append(stage_threads)
+
+        for task in tasks:
+            queues[0].put(task)
+
+        # shut down stage by stage, every worker receives one sentinel
+        for idx, stage_threads in enumerate(threads):
+            for _ in stage_threads:
+                queues[idx].put(None)
+            for t in stage_threads:
+                t.join()
+
+        if self.shard is not None:
+            self._run_deferred()
+
+    def _run_deferred(self):
+        """
+        wait for the rasters claimed by other nodes. Rasters that exist are reported as
+        'other_node'. The others are claimed again (a released or stale lease), and
+        downloaded by this node if the claim succeeds
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        deferred, self._deferred = self._deferred, []
+        with ThreadPoolExecutor(max_workers=max(1, self.n_workers['download'])) as executor:
+            while deferred:
+                waiting = [item for items in executor.map(self._run_deferred_item, deferred) for item in items]
+                if not waiting or self.shard.poll_interval is None:
+                    for item in waiting:
+                        self._record(item)
+                    break
+                time.sleep(self.shard.poll_interval)
+                deferred = waiting
+
+    def _run_deferred_item(self, item):
+        # returns the item if another node still holds its claim
+        if self._done_elsewhere(item):
+            self._record(item)
+            return []
+        item = {key: value for key, value in item.items() if key != 'status'}
+        items = [item]
+        for name, func in [('resolve', self._stage_resolve), ('download', self._stage_download),
+                           ('process', self._stage_process)]:
+            out_items = []
+            for item in items:
+                try:
+                    out_items.extend(func(item))
+                except Exception as e:
+                    self._fail(name, item, e)
+            items = out_items
+        waiting = []
+        for item in items:
+            if item.get('status') == 'other_node':
+                waiting.append(item)
+            else:
+                self._record(item)
+        return waiting
+
+    def _done_elsewhere(self, item):
+        # the raster exists and, when existing rasters are downloaded again, it was
+        # written during this run (by another node)
+        try:
+            mtime = os.path.getmtime(item['filename'])
+        except OSError:
+            return False
+        return self.skip_existing or mtime >= self._time_start
+
+    def dry_run(self, job_spec):
+        """
+        plan a job without resolving or downloading rasters. Only the availability
+        is queried, concurrently with n_availability workers.
+
+        Returns
+        -------
+        df_plan : pd.DataFrame
+            one row per raster with version, cube_code, loc_type, loc_code, raster_id, filename
+            and whether the file already exists
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        tasks = self.plan(job_spec)
+
+        def plan_task(task):
+            try:
+                return list(self._availability_items(task))
+            except Exception as e:
+                print('Availability failed for {0} {1}: {2}'.format(task['cube_code'], task['time_range'], e))
+                return []
+
+        items = []
+        for version, version_tasks in self._group_by_version(tasks):
+            self._ensure_catalogus(version)
+            with ThreadPoolExecutor(max_workers=max(1, self.n_workers['availability'])) as executor:
+                items.extend(item for task_items in executor.map(plan_task, version_tasks)
+                             for item in task_items)
+        df_plan = pd.DataFrame(items, columns=['version', 'cube_code', 'loc_type', 'loc_code', 'raster_id', 'filename'])
+        df_plan['exists'] = [os.path.exists(filename) for filename in df_plan['filename']]
+        return df_plan
+
+    def _ensure_catalogus(self, version):
+        if getattr(self.client, '_catalogus', None) is None or self.client.version != version:
+            self.client.get_catalogus(version=version)
+
+    def _worker(self, name, func, in_q, out_q):
+        while True:
+            item = in_q.get()
+            if item is None:
+                break
+            try:
+                for out_item in func(item):
+                    if out_q is not None:
+                        out_q.put(out_item)
+                    elif out_item.get('status') == 'other_node':
+                        # checked again when the stages are finished, see _run_deferred()
+                        with self._lock:
+                            self._deferred.append(out_item)
+                    else:
+                        self._record(out_item)
+            except Exception as e:
+                self._fail(name, item, e)
+
+    def _fail(self, name, item, e):
+        # bookkeeping of a failed item, errors are reported but never end the worker,
+        # otherwise the stage above would block on a full queue
+        if name == 'availability':
+            print('Availability failed for {0} {1}: {2}'.format(
+                item['cube_code'], item['time_range'], e))
+            item = {'version': item['version'], 'cube_code': item['cube_code'],
+                    'loc_type': None, 'loc_code': None, 'raster_id': None}
+        item['status'] = 'failed'
+        item['stage'] = name
+        item['error'] = repr(e)
+        if self.journal is not None and item['raster_id'] is not None and name != 'process':
+            try:
+                self.journal.set_state(item, _journal.FAILED, error=item['error'])
+            except Exception as journal_error:
+                print('Journal update failed for {0}: {1}'.format(item['raster_id'], journal_error))
+        if self.shard is not None and name in ['resolve', 'download']:
+            try:
+                self.shard.release(item)
+            except Exception as shard_error:
+                print('Lease release failed for {0}: {1}'.format(item['raster_id'], shard_error))
+        self._record(item)
+
+    def _record(self, item):
+        record = {key: item.get(key) for key in [
+            'version', 'cube_code', 'loc_type', 'loc_code', 'raster_id', 'filename', 'status',
+            'stage', 'error', 'nbytes', 'time_resolve', 'time_download', 'result']}
+        with self._lock:
+            self._records.append(record)
+        if self.progress is not None:
+            try:
+                self.progress(record)
+            except Exception as e:
+                print('Progress callback failed: {}'.format(e))
+
+    def _stage_availability(self, task):
+        if self.journal is not None:
+            yield from self._stage_availability_journal(task)
+            return
+        yield from self._availability_items(task)
+
+    def _availability_items(self, task):
+        if self.client.version != task['version']:
+            raise ValueError('client is set to version {0}, task requires {1}'.format(
+                self.client.version, task['version']))
+        cube_info = self.client.get_cube_info(cube_code=task['cube_code'])
+        df_avail = self.client.get_data_availability(cube_info, time_range=task['time_range'])
+        for raster_id in df_avail['raster_id']:
+            for loc_type, loc_code in task['locations']:
+                item = {'version': task['version'], 'cube_code': task['cube_code'],
+                        'raster_id': raster_id, 'loc_type': loc_type, 'loc_code': loc_code}
+                item['filename'] = self.raster_filename(item)
+                yield item
+
+    def _stage_availability_journal(self, task):
+        if not self.journal.is_planned(task['version'], task['cube_code'], task['time_range']):
+            if self.client.version != task['version']:
+                raise ValueError('client is set to version {0}, task requires {1}'.format(
+                    self.client.version, task['version']))
+            cube_info = self.client.get_cube_info(cube_code=task['cube_code'])
+            df_avail = self.client.get_data_availability(cube_info, time_range=task['time_range'])
+            self.journal.add_availability(df_avail, task['version'], task['cube_code'],
+                                          task['time_range'], task['locations'],
+                                          filename=self.raster_filename)
+
+        states = [_journal.PENDING, _journal.URL_RESOLVED]
+        if self.retry_failed:
+            states.append(_journal.FAILED)
+        for row in self.journal.get_items(task['version'], task['cube_code'], task['time_range'], states=states):
+            item = {key: row[key] for key in ['version', 'cube_code', 'raster_id', 'loc_type', 'loc_code']}
+            item['filename'] = row['filename'] or self.raster_filename(item)
+            # reuse a resolved URL from a previous run while it is still valid
+            if row['state'] == _journal.URL_RESOLVED and row['expiry_datetime'] is not None \
+                    and row['expiry_datetime'] > datetime.datetime.now():
+                item['download_url'] = row['download_url']
+                item['expiry_datetime'] = row['expiry_datetime']
+            yield item
+
+    def _stage_resolve(self, item):
+        if self.skip_existing and os.path.exists(item['filename']):
+            item['status'] = 'existing'
+            if self.journal is not None:
+                self.journal.set_state(item, _journal.DOWNLOADED)
+            yield item
+            return
+        if self.shard is not None:
+            if not self.shard.claim(item):
+                item['status'] = 'other_node'
+                yield item
+                return
+            # another node may have finished the raster before this node claimed it
+            if self._done_elsewhere(item):
+                self.shard.release(item)
+                item['status'] = 'existing'
+                if self.journal is not None:
+                    self.journal.set_state(item, _journal.DOWNLOADED)
+                yield item
+                return
+        if 'download_url' in item:
+            yield item
+            return
+        time_start = time.time()
+        cov_object = self.client.get_coverage_url(
+            APItoken=self.APItoken, raster_id=item['raster_id'], cube_code=item['cube_code'],
+            loc_type=item['loc_type'], loc_code=item['loc_code'])
+        item['download_url'] = cov_object['download_url']
+        item['expiry_datetime'] = cov_object['expiry_datetime']
+        item['time_resolve'] = time.time() - time_start
+        if self.journal is not None:
+            self.journal.set_state(item, _journal.URL_RESOLVED)
+        yield item
+
+    def _stage_download(self, item):
+        if item.get('status') in ['existing', 'other_node']:
+            yield item
+            return
+        time_start = time.time()
+        item['nbytes'] = self.client.download_coverage(item['download_url'], item['filename'])
+        item['time_download'] = time.time() - time_start
+        if self.shard is not None:
+            self.shard.release(item)
+        item['status'] = 'downloaded'
+        if self.journal is not None:
+            self.journal.set_state(item, _journal.DOWNLOADED)
+        yield item
+
+    def _stage_process(self, item):
+        if self.process is not None and item.get('status') != 'other_node':
+            item['result'] = self.process(item)
+            item['status'] = 'processed'
+        yield item
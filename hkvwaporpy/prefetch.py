@@ -0,0 +1,152 @@
+import os
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+
+class Prefetcher(object):
+    """
+    download rasters ahead of the position a user is viewing. Given an ordered
+    availability frame and a cursor, the rasters at the cursor and the next lookahead
+    positions are resolved and downloaded in the background into the cache folder.
+    When the cursor jumps, prefetches outside the new window are cancelled.
+    """
+    def __init__(self, client, APItoken, df_avail, cube_code, cache_folder, loc_type=None,
+                 loc_code=None, lookahead=3, n_workers=2):
+        """
+        Parameters
+        ----------
+        client : __fao_wapor_class
+            client to use, normally hkvwaporpy.read_wapor
+        APItoken : str
+            API token generated from the WaPOR portal
+        df_avail : pd.DataFrame
+            availability frame as returned by get_data_availability(), in viewing order
+        cube_code : str
+            code of the cube
+        cache_folder : str
+            folder in which the rasters are stored as {raster_id}.tif
+        loc_type : str
+            choose from 'BASIN' or 'COUNTRY' (only for L2 cubes)
+        loc_code : str
+            code corresponding to location (only for L2 cubes)
+        lookahead : int
+            number of positions after the cursor to prefetch
+        n_workers : int
+            number of concurrent downloads
+        """
+        self.client = client
+        self.APItoken = APItoken
+        self.raster_ids = df_avail['raster_id'].tolist()
+        self.cube_code = cube_code
+        self.cache_folder = cache_folder
+        self.loc_type = loc_type
+        self.loc_code = loc_code
+        self.lookahead = lookahead
+        self.cursor = None
+
+        self._executor = ThreadPoolExecutor(max_workers=n_workers)
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.raster_ids)
+
+    def filename(self, position):
+        """
+        local filename of the raster at position
+        """
+        return os.path.join(self.cache_folder, '{}.tif'.format(self.raster_ids[position]))
+
+    def seek(self, position):
+        """
+        move the cursor to position, cancel stale prefetches and schedule the
+        rasters from position up to position + lookahead
+        """
+        if not 0 <= position < len(self.raster_ids):
+            raise IndexError('position {0} out of range (0-{1})'.format(position, len(self.raster_ids) - 1))
+        window = range(position, min(position + self.lookahead + 1, len(self.raster_ids)))
+        with self._lock:
+            self.cursor = position
+            for pos in list(self._futures):
+                if pos in window:
+                    continue
+                future, cancel = self._futures[pos]
+                if future.done() or future.cancel():
+                    del self._futures[pos]
+                else:
+                    # a running fetch is kept until it finishes, so seeking back reuses
+                    # it instead of starting a second download of the same raster
+                    cancel.set()
+            for pos in window:
+                if pos in self._futures:
+                    future, cancel = self._futures[pos]
+                    if not future.done():
+                        cancel.clear()
+                        continue
+                    # cancelled or failed fetches are scheduled again
+                    if not future.cancelled() and future.exception() is None and future.result() is not None:
+                        continue
+                cancel = threading.Event()
+                self._futures[pos] = (self._executor.submit(self._fetch, pos, cancel), cancel)
+
+    def get(self, position=None):
+        """
+        filename of the raster at position, waits until it is downloaded. The cursor is
+        moved to position, by default the current cursor.
+
+        Returns
+        -------
+        filename : str
+        """
+        if position is None:
+            position = 0 if self.cursor is None else self.cursor
+        self.seek(position)
+        with self._lock:
+            future, _ = self._futures[position]
+        try:
+            filename = future.result()
+        except CancelledError:
+            filename = None
+        if filename is None:
+            # cancelled by a concurrent seek, fetch in this thread
+            filename = self._fetch(position, threading.Event())
+        return filename
+
+    def next(self):
+        """
+        filename of the raster after the cursor
+        """
+        return self.get(0 if self.cursor is None else self.cursor + 1)
+
+    def previous(self):
+        """
+        filename of the raster before the cursor
+        """
+        return self.get(0 if self.cursor is None else self.cursor - 1)
+
+    def close(self):
+        """
+        cancel all prefetches and stop the background threads
+        """
+        with self._lock:
+            for future, cancel in self._futures.values():
+                cancel.set()
+                future.cancel()
+            self._futures = {}
+        self._executor.shutdown(wait=True)
+
+    def _fetch(self, position, cancel):
+        filename = self.filename(position)
+        if os.path.exists(filename):
+            return filename
+        if cancel.is_set():
+            return None
+        cov_object = self.client.get_coverage_url(
+            APItoken=self.APItoken, raster_id=self.raster_ids[position], cube_code=self.cube_code,
+            loc_type=self.loc_type, loc_code=self.loc_code)
+        if cancel.is_set():
+            return None
+        nbytes = self.client.download_coverage(cov_object['download_url'], filename, cancel=cancel)
+        if nbytes is None:
+            return None
+        return filename
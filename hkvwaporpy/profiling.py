@@ -0,0 +1,248 @@
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+PHASES = ['wait', 'transfer', 'decode', 'parse', 'frame', 'other']
+
+
+class _Call(object):
+    __slots__ = ('name', 'start', 'phases', 'stack', 'n_requests', 'nbytes', 'memory_start', 'overlapped')
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.phases = dict.fromkeys(PHASES, 0.)
+        # open phases as [name, start, time spent in nested phases]
+        self.stack = []
+        self.n_requests = 0
+        self.nbytes = 0
+        self.memory_start = 0
+        # another call ran at the same time, so the process wide peak is not its own
+        self.overlapped = False
+
+
+class _CallContext(object):
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.call = None
+
+    def __enter__(self):
+        local = self.profiler._local
+        if getattr(local, 'call', None) is None:
+            self.call = _Call(self.name)
+            with self.profiler._lock:
+                active = self.profiler._active
+                if active:
+                    # the peak must not be reset while other calls are measured
+                    self.call.overlapped = True
+                    for call in active:
+                        call.overlapped = True
+                elif self.profiler.trace_memory and tracemalloc.is_tracing():
+                    tracemalloc.reset_peak()
+                    self.call.memory_start = tracemalloc.get_traced_memory()[0]
+                active.add(self.call)
+            local.call = self.call
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.call is None:
+            # nested public call, its phases count for the outer call
+            return False
+        self.profiler._local.call = None
+        peak_memory = None
+        with self.profiler._lock:
+            # read the peak before another call can reset it
+            if self.profiler.trace_memory and tracemalloc.is_tracing() and not self.call.overlapped:
+                peak_memory = max(0, tracemalloc.get_traced_memory()[1] - self.call.memory_start)
+            self.profiler._active.discard(self.call)
+        self.profiler._finish(self.call, peak_memory, error=exc_type is not None)
+        return False
+
+
+class _PhaseContext(object):
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.call = None
+
+    def __enter__(self):
+        self.call = getattr(self.profiler._local, 'call', None)
+        if self.call is not None:
+            self.call.stack.append([self.name, time.perf_counter(), 0.])
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.call is not None:
+            name, start, nested = self.call.stack.pop()
+            elapsed = time.perf_counter() - start
+            self.call.phases[name] += elapsed - nested
+            if self.call.stack:
+                self.call.stack[-1][2] += elapsed
+        return False
+
+
+class Profiler(object):
+    """
+    opt-in profiling of the public calls of a WaPOR client. Every public call is split
+    into the phases:
+
+        wait      connecting and waiting for the response headers
+        transfer  receiving the response body
+        decode    decoding JSON
+        parse     the Python loop that extracts the fields of interest
+        frame     building the DataFrame
+        other     time not covered by the phases above
+
+    Times are exclusive: time spent in a nested phase is not counted for the outer phase.
+    With trace_memory=True, the peak of the memory allocated during each call is measured with
+    tracemalloc. The tracemalloc peak is process wide, so it is only reported for calls
+    that did not overlap with other profiled calls; for calls running concurrently in
+    several threads (eg. a BulkPipeline) peak_memory is None. Times are measured per
+    thread and are valid in both cases. tracemalloc slows down allocating Python code
+    about 3 times, which inflates the decode, parse and frame phases, so profile time
+    and memory in separate runs.
+
+    In profiling mode each response body is read completely before decoding, so that
+    transfer can be timed separately from decoding. Use as a context manager:
+
+        with hkv.Profiler(hkv.read_wapor) as profiler:
+            cube_info = hkv.read_wapor.get_cube_info('L2_AETI_D')
+            df_avail = hkv.read_wapor.get_data_availability(cube_info)
+        profiler.summary()
+    """
+    def __init__(self, client=None, trace_memory=False):
+        """
+        Parameters
+        ----------
+        client : __fao_wapor_class or None
+            client to profile, attached when the context is entered
+        trace_memory : boolean
+            measure allocation peaks per call with tracemalloc, this slows down the
+            Python phases
+        """
+        self.client = client
+        self.trace_memory = trace_memory
+        self.records = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._active = set()
+        self._started_tracing = False
+
+    def __enter__(self):
+        if self.client is not None:
+            self.attach(self.client)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.detach()
+        return False
+
+    def attach(self, client):
+        """
+        start profiling the calls of client
+        """
+        self.client = client
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        client._profiler = self
+
+    def detach(self):
+        """
+        stop profiling
+        """
+        if self.client is not None and self.client._profiler is self:
+            self.client._profiler = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def call(self, name):
+        """
+        context of a public call, nested calls are counted for the outer call
+        """
+        return _CallContext(self, name)
+
+    def phase(self, name):
+        """
+        context of a phase of the current call
+        """
+        return _PhaseContext(self, name)
+
+    def iter_phase(self, items, name):
+        """
+        iterate over items, counting the time spent producing each item for phase name
+        """
+        iterator = iter(items)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def add_request(self, nbytes):
+        """
+        count a request and its response size for the current call
+        """
+        call = getattr(self._local, 'call', None)
+        if call is not None:
+            call.n_requests += 1
+            call.nbytes += nbytes
+
+    def _finish(self, call, peak_memory=None, error=False):
+        total = time.perf_counter() - call.start
+        record = {'call': call.name, 'total': total}
+        record.update(call.phases)
+        record['other'] = max(0., total - sum(call.phases[phase] for phase in PHASES if phase != 'other'))
+        record['n_requests'] = call.n_requests
+        record['nbytes'] = call.nbytes
+        record['peak_memory'] = peak_memory
+        record['error'] = error
+        with self._lock:
+            self.records.append(record)
+
+    def report(self):
+        """
+        one row per public call with the time per phase in seconds, the number of
+        requests, the number of bytes received and the allocation peak in bytes
+
+        Returns
+        -------
+        df_report : pd.DataFrame
+        """
+        columns = ['call', 'total'] + PHASES + ['n_requests', 'nbytes', 'peak_memory', 'error']
+        with self._lock:
+            return pd.DataFrame(list(self.records), columns=columns)
+
+    def summary(self, df_report=None):
+        """
+        aggregate a report per call name
+
+        Parameters
+        ----------
+        df_report : pd.DataFrame or None
+            report to aggregate, by default the report of this profiler. Reports of
+            several runs can be combined with pd.concat first
+
+        Returns
+        -------
+        df_summary : pd.DataFrame
+            per call name the number of calls, the total time and the time per phase
+            (summed over the calls), the share of each phase and the maximum
+            allocation peak
+        """
+        if df_report is None:
+            df_report = self.report()
+        df_report = df_report.astype({'peak_memory': float})
+        grouped = df_report.groupby('call')
+        df_summary = grouped[['total'] + PHASES + ['n_requests', 'nbytes']].sum()
+        df_summary.insert(0, 'n_calls', grouped.size())
+        for phase in PHASES:
+            df_summary['{}_share'.format(phase)] = df_summary[phase] / df_summary['total']
+        df_summary['peak_memory_max'] = grouped['peak_memory'].max()
+        return df_summary.sort_values('total', ascending=False)
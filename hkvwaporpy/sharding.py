@@ -0,0 +1,233 @@
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+
+
+def raster_key(item):
+    """
+    key that identifies a raster at a location, used for hashing and lease files
+    """
+    key = '{0}__{1}__{2}'.format(item['cube_code'], item['loc_code'] or '', item['raster_id'])
+    return key.replace(os.sep, '_').replace('/', '_')
+
+
+class HashShard(object):
+    """
+    static partitioning of rasters over a fixed set of nodes with rendezvous
+    (highest random weight) hashing. Every node needs the same list of node names,
+    and no coordination is required at run time. When a node is removed from the
+    list, only the rasters of that node move to the other nodes.
+    """
+    # ownership never changes during a run, so there is no point in waiting for it
+    poll_interval = None
+
+    def __init__(self, node_id, nodes):
+        """
+        Parameters
+        ----------
+        node_id : str
+            name of this node, must be in nodes
+        nodes : list
+            names of all nodes taking part in the job
+        """
+        if node_id not in nodes:
+            raise ValueError('node_id {0} is not in nodes {1}'.format(node_id, nodes))
+        self.node_id = node_id
+        self.nodes = list(nodes)
+
+    def owner(self, item):
+        """
+        name of the node that downloads the raster described by item
+        """
+        key = raster_key(item)
+
+        def weight(node):
+            return hashlib.md5('{0}:{1}'.format(node, key).encode()).hexdigest()
+        return max(self.nodes, key=weight)
+
+    def claim(self, item):
+        return self.owner(item) == self.node_id
+
+    def release(self, item):
+        pass
+
+    def close(self):
+        pass
+
+
+class LeaseShard(object):
+    """
+    dynamic partitioning of rasters with lease files on a shared filesystem. A node
+    claims a raster by creating {lease_folder}/{key}.lease exclusively, so every raster
+    is handled by a single node at a time and faster nodes take more rasters. While a
+    node holds leases, a heartbeat thread refreshes their modification time. Leases
+    that were not refreshed within ttl seconds belong to a dead node and are reclaimed.
+    Each lease file records the node and a lease id, so a node only refreshes and
+    removes its own leases, never a lease that another node took over.
+
+    The clocks of the nodes and the file server should be synchronised within a
+    fraction of ttl.
+
+    At the end of a run, a BulkPipeline waits for the rasters leased by other nodes
+    and checks them every poll_interval seconds: once a lease is released or stale
+    and the raster does not exist, this node claims and downloads it.
+    """
+    def __init__(self, lease_folder, node_id=None, ttl=300, heartbeat=None, poll_interval=None):
+        """
+        Parameters
+        ----------
+        lease_folder : str
+            folder on the shared filesystem for the lease files
+        node_id : str or None
+            name of this node, defaults to {hostname}-{pid}
+        ttl : float
+            seconds after which a lease without heartbeat is considered stale
+        heartbeat : float or None
+            seconds between refreshes of the held leases, defaults to ttl / 3
+        poll_interval : float or None
+            seconds between checks of rasters leased by other nodes at the end of a
+            run, defaults to the heartbeat with a maximum of 10 seconds
+        """
+        self.lease_folder = lease_folder
+        self.node_id = node_id or '{0}-{1}'.format(socket.gethostname(), os.getpid())
+        self.ttl = ttl
+        self.heartbeat = heartbeat or ttl / 3.
+        self.poll_interval = poll_interval or min(self.heartbeat, 10.)
+        os.makedirs(lease_folder, exist_ok=True)
+
+        # lease file path and lease id of the held leases
+        self._held = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _lease_path(self, item):
+        return os.path.join(self.lease_folder, '{}.lease'.format(raster_key(item)))
+
+    def _create(self, path, lease_id):
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'node_id': self.node_id, 'lease_id': lease_id, 'created': time.time()}, f)
+        return True
+
+    def _owns(self, path, lease_id):
+        """
+        check that the lease file at path is the lease lease_id of this node and was
+        not taken over by another node
+        """
+        try:
+            with open(path) as f:
+                lease = json.load(f)
+        except (FileNotFoundError, ValueError):
+            # removed, or just created by another node and not yet written
+            return False
+        return lease.get('node_id') == self.node_id and lease.get('lease_id') == lease_id
+
+    def _is_stale(self, path):
+        try:
+            return time.time() - os.stat(path).st_mtime > self.ttl
+        except FileNotFoundError:
+            return False
+
+    def _reclaim(self, path, lease_id):
+        # move the stale lease aside, only one node succeeds with the rename
+        tombstone = '{0}.stale.{1}'.format(path, uuid.uuid4().hex)
+        try:
+            os.rename(path, tombstone)
+        except FileNotFoundError:
+            return False
+        if not self._is_stale(tombstone):
+            # another node renewed or reclaimed the lease in the meantime, put it back.
+            # If a third node created a new lease in between, the old lease is lost and
+            # its node finds out at its next heartbeat
+            try:
+                os.link(tombstone, path)
+            except FileExistsError:
+                pass
+            os.remove(tombstone)
+            return False
+        os.remove(tombstone)
+        return self._create(path, lease_id) and self._owns(path, lease_id)
+
+    def claim(self, item):
+        """
+        try to take the lease of the raster described by item
+
+        Returns
+        -------
+        claimed : boolean
+            True if this node holds the lease and should download the raster
+        """
+        path = self._lease_path(item)
+        lease_id = uuid.uuid4().hex
+        claimed = self._create(path, lease_id)
+        if not claimed and self._is_stale(path):
+            claimed = self._reclaim(path, lease_id)
+        if claimed:
+            with self._lock:
+                self._held[path] = lease_id
+            self._start_heartbeat()
+        return claimed
+
+    def _remove(self, path, lease_id):
+        # only remove the lease if no other node took it over
+        if self._owns(path, lease_id):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def release(self, item):
+        """
+        remove the lease of the raster described by item, unless another node took it over
+        """
+        path = self._lease_path(item)
+        with self._lock:
+            lease_id = self._held.pop(path, None)
+        if lease_id is not None:
+            self._remove(path, lease_id)
+
+    def close(self):
+        """
+        stop the heartbeat and remove all leases held by this node
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            held, self._held = self._held, {}
+        for path, lease_id in held.items():
+            self._remove(path, lease_id)
+
+    def _start_heartbeat(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._renew)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _renew(self):
+        while not self._stop.wait(self.heartbeat):
+            with self._lock:
+                held = list(self._held.items())
+            for path, lease_id in held:
+                if self._owns(path, lease_id):
+                    try:
+                        os.utime(path)
+                    except FileNotFoundError:
+                        pass
+                else:
+                    # the lease was taken over, stop refreshing the lease of another node
+                    with self._lock:
+                        if self._held.get(path) == lease_id:
+                            del self._held[path]
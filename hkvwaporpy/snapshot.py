@@ -0,0 +1,146 @@
+import datetime
+import gzip
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from hkvwaporpy import json_parse
+from hkvwaporpy.fao_wapor_api import __fao_wapor_class as _fao_wapor_class
+
+# version of the snapshot file layout, increase when the layout changes
+SNAPSHOT_FORMAT = 1
+
+
+def export_snapshot(client, path, versions=('2.0',), cube_codes=None, n_workers=8):
+    """
+    export the catalogus, the dimensions, measures and dimension members of every cube
+    and the locations to a single gzip compressed JSON file
+
+    Parameters
+    ----------
+    client : __fao_wapor_class
+        client with access to the catalog API, normally hkvwaporpy.read_wapor
+    path : str
+        output file (eg. wapor_metadata.json.gz)
+    versions : list
+        WaPOR versions to include
+    cube_codes : list or None
+        codes of the cubes to include, by default all cubes in the catalogus
+    n_workers : int
+        number of concurrent requests
+
+    Returns
+    -------
+    snapshot : dict
+        the exported snapshot
+    """
+    from hkvwaporpy import __version__
+
+    snapshot = {
+        'format': SNAPSHOT_FORMAT,
+        'created': datetime.datetime.now().isoformat(),
+        'hkvwaporpy_version': __version__,
+        'versions': {},
+    }
+    for version in versions:
+        catalogus = client._fetch_catalogus_items(version)
+        codes = [item['code'] for item in catalogus]
+        if cube_codes is not None:
+            codes = [code for code in codes if code in cube_codes]
+
+        def fetch_cube(cube_code):
+            dimensions = client._fetch_dimensions_items(cube_code, version)
+            measures = client._fetch_measures_items(cube_code, version)
+            members = {}
+            for dimension in [item['code'] for item in dimensions]:
+                if dimension in ['SEASON', 'STAGE']:
+                    members[dimension] = client._fetch_dimension_members_items(
+                        cube_code, dimension, version)
+            return cube_code, dimensions, measures, members
+
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            cubes = list(executor.map(fetch_cube, codes))
+
+        workspace_code = client.workspace_code[version]
+        locations = {}
+        for filter_value in ['BASIN', 'COUNTRY']:
+            locations[filter_value] = [
+                list(row) for row in client._query_locations(filter_value, workspace_code)]
+
+        snapshot['versions'][version] = {
+            'catalogus': catalogus,
+            'dimensions': {code: dimensions for code, dimensions, _, _ in cubes},
+            'measures': {code: measures for code, _, measures, _ in cubes},
+            'members': {code: members for code, _, _, members in cubes},
+            'locations': locations,
+        }
+
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        json.dump(snapshot, f)
+    return snapshot
+
+
+def load_snapshot(path):
+    """
+    load a snapshot created with export_snapshot() into a client that answers
+    get_catalogus(), get_info_cube(), get_cube_info() and get_locations() without
+    requests to the catalog API. Requests for coverage URLs still go to the WaPOR API.
+
+    Parameters
+    ----------
+    path : str
+        snapshot file
+
+    Returns
+    -------
+    client : SnapshotClient
+        client with the snapshot loaded and the catalogus of the first version selected
+    """
+    with gzip.open(path, 'rb') as f:
+        snapshot = json_parse.loads(f.read())
+    if snapshot.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError('snapshot format {0} is not supported, expected {1}'.format(
+            snapshot.get('format'), SNAPSHOT_FORMAT))
+    return SnapshotClient(snapshot)
+
+
+class SnapshotClient(_fao_wapor_class):
+    """
+    WaPOR client that reads all catalog metadata from a snapshot
+    """
+    def __init__(self, snapshot):
+        super().__init__()
+        self.snapshot = snapshot
+        versions = list(snapshot['versions'])
+        if versions:
+            self.get_catalogus(version=versions[0])
+
+    def _get_version(self, version):
+        if version not in self.snapshot['versions']:
+            raise KeyError('version {} is not in snapshot'.format(version))
+        return self.snapshot['versions'][version]
+
+    def _get_cube(self, key, cube_code, version):
+        items = self._get_version(version)[key]
+        if cube_code not in items:
+            raise KeyError('{0} of {1} (version {2}) are not in snapshot'.format(key, cube_code, version))
+        return items[cube_code]
+
+    def _fetch_catalogus_items(self, version, overview=False, paged=False):
+        return self._get_version(version)['catalogus']
+
+    def _fetch_measures_items(self, cube_code, version, overview=False):
+        return self._get_cube('measures', cube_code, version)
+
+    def _fetch_dimensions_items(self, cube_code, version, overview=False):
+        return self._get_cube('dimensions', cube_code, version)
+
+    def _fetch_dimension_members_items(self, cube_code, dimension, version, overview=False, paged=False, sort='code'):
+        members = self._get_cube('members', cube_code, version)
+        if dimension not in members:
+            raise KeyError('members of {0} {1} (version {2}) are not in snapshot'.format(
+                cube_code, dimension, version))
+        return members[dimension]
+
+    def _query_locations(self, filter_value, workspace_code):
+        version = {code: version for version, code in self.workspace_code.items()}[workspace_code]
+        return [tuple(row) for row in self._get_version(version)['locations'][filter_value]]
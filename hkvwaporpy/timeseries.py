@@ -0,0 +1,223 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from hkvwaporpy.aggregate import _import_gdal, _read_window
+
+
+def _import_h5py():
+    try:
+        import h5py
+    except ImportError:
+        raise ImportError('the time-series store requires h5py (pip install h5py)')
+    return h5py
+
+
+def period_labels(df_avail):
+    """
+    sortable period labels of the rows of an availability frame
+
+    Parameters
+    ----------
+    df_avail : pd.DataFrame
+        availability frame as returned by get_data_availability()
+
+    Returns
+    -------
+    labels : list
+        'yyyy-mm-dd' for dekadal, daily and monthly cubes and 'yyyy' for annual cubes,
+        followed by the season and stage if the cube has these dimensions
+    """
+    df = df_avail.reset_index()
+    if 'start_dekad' in df.columns:
+        labels = ['{0}-{1}-{2}'.format(y, s[:2], s[2:4]) for y, s in zip(df['year'], df['start_dekad'])]
+    elif 'date' in df.columns:
+        labels = [pd.Timestamp(d).strftime('%Y-%m-%d') for d in df['date']]
+    elif 'month' in df.columns:
+        labels = [pd.Timestamp(m).strftime('%Y-%m-%d') for m in df['month']]
+    else:
+        labels = [str(y) for y in df['year']]
+    for column in ['season', 'stage']:
+        if column in df.columns:
+            labels = ['{0}_{1}'.format(label, value) for label, value in zip(labels, df[column])]
+    return labels
+
+
+class TimeSeriesStore(object):
+    """
+    chunked and compressed HDF5 store of the rasters of one cube and location, laid out
+    for time-series access. The data is stored as a (time, row, column) array in chunks
+    of time_chunk periods by chunk_size x chunk_size pixels, so the history of a pixel
+    is read from a few chunks instead of from every raster.
+
+    The attribute n_periods is written last and marks an ingest as complete: rows of
+    data and periods beyond it (left by an interrupted ingest) are ignored when
+    reading and overwritten by the next ingest.
+    """
+    def __init__(self, path, mode='a', time_chunk=36, chunk_size=32):
+        """
+        Parameters
+        ----------
+        path : str
+            path of the HDF5 file, created if it does not exist
+        mode : str
+            'a' to read and ingest, 'r' to only read
+        time_chunk : int
+            number of periods per chunk, used when the store is created
+        chunk_size : int
+            number of rows and columns per chunk, used when the store is created
+        """
+        h5py = _import_h5py()
+        self.path = path
+        self.time_chunk = time_chunk
+        self.chunk_size = chunk_size
+        self._file = h5py.File(path, mode)
+        if 'period' in self._file:
+            n_periods = self._file.attrs.get('n_periods', self._file['period'].shape[0])
+            self._periods = [p.decode() if isinstance(p, bytes) else p for p in self._file['period'][:n_periods]]
+        else:
+            self._periods = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    @property
+    def periods(self):
+        """
+        list of the periods in the store, in the order of the time axis
+        """
+        return list(self._periods)
+
+    def _create(self, ds_first):
+        h5py = _import_h5py()
+        nx, ny = ds_first.RasterXSize, ds_first.RasterYSize
+        self._file.create_dataset(
+            'data', shape=(0, ny, nx), maxshape=(None, ny, nx), dtype='float32',
+            chunks=(self.time_chunk, min(self.chunk_size, ny), min(self.chunk_size, nx)),
+            compression='gzip', compression_opts=4, shuffle=True, fillvalue=np.nan)
+        for name in ['period', 'raster_id']:
+            self._file.create_dataset(name, shape=(0,), maxshape=(None,), dtype=h5py.string_dtype())
+        self._file.attrs['geotransform'] = ds_first.GetGeoTransform()
+        self._file.attrs['projection'] = ds_first.GetProjection()
+        self._file.attrs['n_periods'] = 0
+
+    def ingest(self, df_avail, raster_folder):
+        """
+        add the rasters of an availability frame that are not yet in the store. The
+        rasters are copied in strips of chunk rows, so only one strip of every new
+        raster is held in memory.
+
+        Parameters
+        ----------
+        df_avail : pd.DataFrame
+            availability frame as returned by get_data_availability()
+        raster_folder : str
+            folder containing the downloaded rasters as {raster_id}.tif, not used if
+            df_avail has a 'filename' column
+
+        Returns
+        -------
+        n_new : int
+            number of periods added
+        """
+        gdal = _import_gdal()
+        df = df_avail.reset_index()
+        df['period'] = period_labels(df_avail)
+        if 'filename' not in df.columns:
+            df['filename'] = [os.path.join(raster_folder, '{}.tif'.format(raster_id))
+                              for raster_id in df['raster_id']]
+        existing = set(self._periods)
+        df = df[~df['period'].isin(existing)].drop_duplicates('period').sort_values('period')
+        if df.empty:
+            return 0
+
+        filenames = df['filename'].tolist()
+        # opened once for all strips and closed when the ingest ends, so no handles
+        # are kept between ingests and a raster downloaded again is not read stale
+        datasets = {}
+        try:
+            for filename in filenames:
+                datasets[filename] = gdal.Open(filename)
+            if 'data' not in self._file:
+                self._create(datasets[filenames[0]])
+            data = self._file['data']
+            _, ny, nx = data.shape
+            n_old = len(self._periods)
+            for filename, ds in datasets.items():
+                if (ds.RasterXSize, ds.RasterYSize) != (nx, ny):
+                    raise ValueError('{0} does not have the grid of the store ({1} x {2})'.format(filename, nx, ny))
+
+            n_new = len(filenames)
+            # also drops rows of an interrupted ingest
+            data.resize(n_old + n_new, axis=0)
+            strip_height = data.chunks[1]
+            for yoff in range(0, ny, strip_height):
+                height = min(strip_height, ny - yoff)
+                strip = np.empty((n_new, height, nx), dtype=np.float32)
+                for idx, filename in enumerate(filenames):
+                    values, valid = _read_window(datasets[filename], (0, yoff, nx, height))
+                    values[~valid] = np.nan
+                    strip[idx] = values
+                data[n_old:, yoff:yoff + height, :] = strip
+        finally:
+            datasets.clear()
+
+        for name, values in [('period', df['period'].tolist()), ('raster_id', df['raster_id'].tolist())]:
+            self._file[name].resize(n_old + n_new, axis=0)
+            self._file[name][n_old:] = values
+        self._file.attrs['n_periods'] = n_old + n_new
+        self._file.flush()
+        self._periods.extend(df['period'].tolist())
+        return n_new
+
+    def read_pixel(self, row, col):
+        """
+        history of a single pixel
+
+        Parameters
+        ----------
+        row, col : int
+            row and column of the pixel
+
+        Returns
+        -------
+        series : pd.Series
+            values of the pixel indexed and sorted by period, NaN where nodata
+        """
+        values = self._file['data'][:len(self._periods), row, col]
+        return pd.Series(values, index=pd.Index(self._periods, name='period')).sort_index()
+
+    def read_point(self, x, y):
+        """
+        history of the pixel containing the point (x, y), in the coordinates of the rasters
+
+        Returns
+        -------
+        series : pd.Series
+            values of the pixel indexed and sorted by period, NaN where nodata
+        """
+        x0, dx, _, y0, _, dy = self._file.attrs['geotransform']
+        col = int((x - x0) // dx)
+        row = int((y - y0) // dy)
+        _, ny, nx = self._file['data'].shape
+        if not (0 <= row < ny and 0 <= col < nx):
+            raise ValueError('point ({0}, {1}) is outside the store'.format(x, y))
+        return self.read_pixel(row, col)
+
+    def read_period(self, period):
+        """
+        raster of a single period
+
+        Returns
+        -------
+        array : np.ndarray
+            values of the period, NaN where nodata
+        """
+        return self._file['data'][self._periods.index(period)]
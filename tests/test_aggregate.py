@@ -0,0 +1,126 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from hkvwaporpy import aggregate
+from hkvwaporpy.aggregate import _aggregate_block, dekad_days, plan_aggregation
+from hkvwaporpy.cube_info import CubeInfo
+from hkvwaporpy.fao_wapor_api import __fao_wapor_class as _fao_wapor_class
+from hkvwaporpy.timeseries import period_labels
+
+DEKAD_CUBE = CubeInfo.from_items(
+    'L2_AETI_D', '2.0', {}, [{'code': 'DEKAD', 'workspaceCode': 'WAPOR_2'}],
+    [{'code': 'WATER_MM', 'unit': 'mm'}], {})
+
+
+def dekad_rows(start, end):
+    """
+    availability rows as yielded by _query_data_availability for the dekads from start
+    up to and including end (datetime.date of the first day of a dekad)
+    """
+    rows = []
+    date = start
+    while date <= end:
+        if date.day < 21:
+            last = date.day + 9
+        else:
+            last = (date.replace(day=28) + datetime.timedelta(days=4)).replace(day=1) - datetime.timedelta(days=1)
+            last = last.day
+        value = '{0:%Y-%m}-D{1} | {2:02d} to {3:02d}'.format(date, date.day // 10 + 1, date.day, last)
+        rows.append(([value], 'L2_AETI_{0:%y%m}{1}'.format(date, date.day // 10 + 1), 'EPSG:4326', [0, 0, 1, 1]))
+        date = date + datetime.timedelta(days=10) if date.day < 21 else \
+            (date.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+    return rows
+
+
+def dekad_availability(start, end):
+    """
+    availability frame of a dekadal cube built by get_data_availability()
+    """
+    client = _fao_wapor_class()
+    client._query_data_availability = lambda *args: iter(dekad_rows(start, end))
+    return client.get_data_availability(DEKAD_CUBE, time_range='[{0},{1}]'.format(start, end))
+
+
+def test_dekadal_frame_has_mmdd_strings():
+    df_avail = dekad_availability(datetime.date(2015, 1, 1), datetime.date(2015, 2, 21))
+    assert df_avail['start_dekad'].tolist() == ['0101', '0111', '0121', '0201', '0211', '0221']
+    assert df_avail['end_dekad'].tolist() == ['0110', '0120', '0131', '0210', '0220', '0228']
+    assert df_avail.index.tolist() == ['2015'] * 6
+    assert period_labels(df_avail)[:2] == ['2015-01-01', '2015-01-11']
+
+
+def test_plan_aggregation_of_dekadal_frame():
+    df_avail = dekad_availability(datetime.date(2015, 1, 1), datetime.date(2015, 2, 21))
+    df_plan = plan_aggregation(df_avail, period='month')
+    assert df_plan.groupby('period')['n_days'].sum().to_dict() == {'2015-01': 31, '2015-02': 28}
+
+
+def test_dekad_days():
+    assert dekad_days(2015, '0101') == 10
+    assert dekad_days(2015, '0111') == 10
+    assert dekad_days(2015, '0121') == 11
+    assert dekad_days(2015, '0221') == 8
+    assert dekad_days('2016', '0221') == 9
+    assert dekad_days(2015, '0421') == 10
+
+
+def test_plan_aggregation_flags_incomplete_periods():
+    # the first dekad of 2016-01 and the season 2016-DJF without the first two dekads
+    df_avail = dekad_availability(datetime.date(2015, 12, 21), datetime.date(2016, 2, 21))
+    df_avail = pd.concat([df_avail, dekad_availability(datetime.date(2016, 3, 1), datetime.date(2016, 3, 1))])
+
+    df_month = plan_aggregation(df_avail, period='month').groupby('period').first()
+    assert df_month['complete'].to_dict() == {
+        '2015-12': False, '2016-01': True, '2016-02': True, '2016-03': False}
+    assert df_month['period_days'].to_dict() == {
+        '2015-12': 31, '2016-01': 31, '2016-02': 29, '2016-03': 31}
+
+    df_season = plan_aggregation(df_avail, period='season').groupby('period').agg(
+        n_days=('n_days', 'sum'), period_days=('period_days', 'first'), complete=('complete', 'first'))
+    assert df_season.loc['2016-DJF'].tolist() == [11 + 31 + 29, 31 + 31 + 29, False]
+    assert df_season.loc['2016-MAM'].tolist() == [10, 92, False]
+
+    df_full = dekad_availability(datetime.date(2015, 12, 1), datetime.date(2016, 2, 21))
+    df_season = plan_aggregation(df_full, period='season')
+    assert df_season['complete'].all()
+    assert df_season['n_days'].sum() == df_season['period_days'].iloc[0] == 91
+
+
+def stub_blocks(monkeypatch, blocks):
+    """
+    replace _read_block by a lookup of (data, valid) per filename
+    """
+    monkeypatch.setattr(aggregate, '_read_block', lambda filename, window: blocks[filename])
+
+
+def test_aggregate_block_weights_days(monkeypatch):
+    stub_blocks(monkeypatch, {
+        'a': (np.array([[1., 2.]], dtype=np.float32), np.array([[True, True]])),
+        'b': (np.array([[3., 4.]], dtype=np.float32), np.array([[True, True]])),
+    })
+    window = (0, 0, 2, 1)
+    _, total, nodata_mask = _aggregate_block(['a', 'b'], [10, 11], window, 'sum', False)
+    np.testing.assert_allclose(total, [[10 + 33, 20 + 44]])
+    assert not nodata_mask.any()
+
+    _, mean, _ = _aggregate_block(['a', 'b'], [10, 11], window, 'mean', False)
+    np.testing.assert_allclose(mean, [[43 / 21., 64 / 21.]], rtol=1e-6)
+
+
+def test_aggregate_block_nodata(monkeypatch):
+    stub_blocks(monkeypatch, {
+        'a': (np.array([[1., -9999., -9999.]], dtype=np.float32), np.array([[True, False, False]])),
+        'b': (np.array([[3., 4., -9999.]], dtype=np.float32), np.array([[True, True, False]])),
+    })
+    window = (0, 0, 3, 1)
+    _, _, nodata_mask = _aggregate_block(['a', 'b'], [10, 8], window, 'sum', False)
+    assert nodata_mask.tolist() == [[False, True, True]]
+
+    _, total, nodata_mask = _aggregate_block(['a', 'b'], [10, 8], window, 'sum', True)
+    assert nodata_mask.tolist() == [[False, False, True]]
+    np.testing.assert_allclose(total[0, :2], [10 + 24, 32])
+
+    _, mean, nodata_mask = _aggregate_block(['a', 'b'], [10, 8], window, 'mean', True)
+    np.testing.assert_allclose(mean[0, :2], [34 / 18., 4.])
@@ -0,0 +1,53 @@
+import json
+
+from hkvwaporpy.availability import get_multi_availability
+from hkvwaporpy.cube_info import CubeInfo
+from hkvwaporpy.fao_wapor_api import __fao_wapor_class as _fao_wapor_class
+
+
+class FakeResponse(object):
+    def __init__(self, ok, body):
+        self.ok = ok
+        self.content = json.dumps(body).encode()
+
+
+def dekad_cube(cube_code):
+    return CubeInfo.from_items(
+        cube_code, '2.0', {}, [{'code': 'DEKAD', 'workspaceCode': 'WAPOR_2'}],
+        [{'code': 'WATER_MM', 'unit': 'mm'}], {})
+
+
+def fake_client(responses):
+    """
+    client without network access, answering availability requests of a cube with
+    the response in responses
+    """
+    client = _fao_wapor_class()
+    client.json_backend = 'json'
+    client.get_cube_info = dekad_cube
+
+    def request(method, url, json=None, **kwargs):
+        return responses[json['params']['cube']['code']]
+    client._request = request
+    return client
+
+
+def test_empty_response_gives_empty_frame():
+    client = fake_client({'L2_AETI_D': FakeResponse(True, {'response': {'items': []}})})
+    df_avail = client.get_data_availability(dekad_cube('L2_AETI_D'))
+    assert df_avail.empty
+    assert df_avail.index.name == 'year'
+    assert list(df_avail.columns) == ['start_dekad', 'end_dekad', 'raster_id', 'bbox_srid', 'bbox_value']
+
+
+def test_multi_availability_tells_empty_from_failed():
+    client = fake_client({
+        'L2_AETI_D': FakeResponse(True, {'response': {'items': []}}),
+        'L2_T_D': FakeResponse(False, {'error': 'Bad request', 'message': 'cube not found'}),
+    })
+    df_long = get_multi_availability(client, cube_codes=['L2_AETI_D', 'L2_T_D'], n_workers=2)
+
+    assert df_long.empty
+    df_failed = df_long.attrs['failed']
+    assert df_failed['cube_code'].tolist() == ['L2_T_D']
+    assert 'cube not found' in df_failed['error'].iloc[0]
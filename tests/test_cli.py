@@ -0,0 +1,92 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+import hkvwaporpy
+from hkvwaporpy.cli import main
+
+RASTER_IDS = ['L1_AETI_1501', 'L1_AETI_1502', 'L1_AETI_1503']
+
+
+class FakeClient(object):
+    """
+    client without network access, downloads of the raster ids in fail raise
+    """
+    def __init__(self, fail=()):
+        self.fail = fail
+        self.version = '2.0'
+        self._catalogus = None
+
+    def get_catalogus(self, version):
+        self.version = version
+        self._catalogus = pd.DataFrame()
+
+    def get_cube_info(self, cube_code):
+        return cube_code
+
+    def get_data_availability(self, cube_info, time_range):
+        return pd.DataFrame({'raster_id': RASTER_IDS})
+
+    def get_coverage_url(self, APItoken, raster_id, cube_code, loc_type=None, loc_code=None):
+        return {'download_url': raster_id, 'expiry_datetime': None}
+
+    def download_coverage(self, download_url, filename):
+        if download_url in self.fail:
+            raise IOError('download of {} failed'.format(download_url))
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, 'w') as f:
+            f.write(download_url)
+        return len(download_url)
+
+
+@pytest.fixture
+def fetch_args(tmp_path, monkeypatch):
+    monkeypatch.setattr(hkvwaporpy, 'read_wapor', FakeClient())
+    return ['fetch', '--cube', 'L1_AETI_D', '--years', '2015', '--output', str(tmp_path), '--quiet']
+
+
+@pytest.mark.parametrize('argv, message', [
+    (['fetch', '--cube', 'L2_AETI_D', '--years', '2015'], '--cube L2_AETI_D requires --loc-type and --loc-code'),
+    (['fetch', '--cube', 'L1_AETI_D', '--years', '2015', '--loc-code', 'ZAM'], '--loc-code requires --loc-type'),
+    (['fetch', '--cube', 'L1_AETI_D', '--years', '2015', '--loc-type', 'BASIN'],
+     '--loc-type requires at least one --loc-code'),
+    (['fetch', '--cube', 'L1_AETI_D'], 'one of the arguments --range --years is required'),
+])
+def test_parse_errors(capsys, argv, message):
+    with pytest.raises(SystemExit) as excinfo:
+        main(argv)
+    assert excinfo.value.code == 2
+    assert message in capsys.readouterr().err
+
+
+def test_dry_run_plan_on_stdout(capsys, fetch_args):
+    assert main(fetch_args + ['--dry-run']) == 0
+    out, err = capsys.readouterr()
+    assert [line.split('\t')[2] for line in out.splitlines()] == RASTER_IDS
+    assert 'missing' in out
+    assert 'L1_AETI_1501' not in err
+
+
+def test_dry_run_plan_on_stderr_with_summary_on_stdout(capsys, fetch_args):
+    assert main(fetch_args + ['--dry-run', '--summary', '-']) == 0
+    out, err = capsys.readouterr()
+    summary = json.loads(out)
+    assert summary['dry_run']
+    assert summary['n_missing'] == 3
+    assert [line.split('\t')[2] for line in err.splitlines() if '\t' in line] == RASTER_IDS
+
+
+def test_exit_codes(capsys, monkeypatch, fetch_args):
+    monkeypatch.delenv('WAPOR_API_TOKEN', raising=False)
+    assert main(fetch_args) == 2
+    assert 'an API token is required' in capsys.readouterr().err
+
+    assert main(fetch_args + ['--token', 'token', '--summary', '-']) == 0
+    summary = json.loads(capsys.readouterr().out)
+    assert summary['status'] == {'downloaded': 3}
+
+    monkeypatch.setattr(hkvwaporpy, 'read_wapor', FakeClient(fail=['L1_AETI_1502']))
+    assert main(fetch_args + ['--token', 'token', '--no-skip-existing']) == 1
+    assert capsys.readouterr().out == ''
@@ -0,0 +1,50 @@
+import pickle
+
+from hkvwaporpy.cube_info import CubeInfo
+from hkvwaporpy.fao_wapor_api import __fao_wapor_class as _fao_wapor_class
+
+
+def seasonal_cube(caption='Season 1'):
+    return CubeInfo.from_items(
+        'L2_PHE_S', '2.0', {'format': 'raster', 'unit': 'day'},
+        [{'code': 'SEASON', 'caption': 'Season', 'type': 'WHAT', 'workspaceCode': 'WAPOR_2'},
+         {'code': 'STAGE', 'caption': 'Stage', 'type': 'WHAT', 'workspaceCode': 'WAPOR_2'},
+         {'code': 'YEAR', 'caption': 'Year', 'type': 'TIME', 'workspaceCode': 'WAPOR_2', 'extra': 1}],
+        [{'code': 'PHE', 'caption': 'Phenology', 'unit': 'day'}],
+        {'SEASON': [{'code': 'S1', 'caption': caption}, {'code': 'S2', 'caption': 'Season 2'}],
+         'STAGE': [{'code': 'SOS', 'caption': 'Start'}, {'code': 'EOS', 'caption': 'End'}]})
+
+
+def test_equal_cubes_have_equal_hashes():
+    cube_info = seasonal_cube()
+    assert cube_info == seasonal_cube()
+    assert hash(cube_info) == hash(seasonal_cube())
+    assert cube_info != seasonal_cube(caption='First season')
+    assert len({cube_info, seasonal_cube(), seasonal_cube(caption='First season')}) == 2
+
+
+def test_pickle_round_trip():
+    cube_info = seasonal_cube()
+    restored = pickle.loads(pickle.dumps(cube_info))
+    assert restored == cube_info
+    assert hash(restored) == hash(cube_info)
+    assert restored.additional_info == cube_info.additional_info
+    assert restored.dimensions[0].raw == cube_info.dimensions[0].raw
+
+
+def test_frame_round_trip():
+    cube_info = seasonal_cube()
+    df_cube_info = cube_info.to_frame()
+    assert df_cube_info.at['dimensions', 'L2_PHE_S'].at['season', 'SEASON'] == ['S1', 'S2']
+    restored = CubeInfo.from_frame(df_cube_info, version='2.0')
+    assert restored == cube_info
+    assert restored.get_dimension('SEASON').members[0].caption == 'Season 1'
+    assert restored.additional_info == cube_info.additional_info
+
+
+def test_frame_of_cached_cube_is_not_parsed_again():
+    client = _fao_wapor_class()
+    client.version = '2.0'
+    cube_info = seasonal_cube()
+    client._cube_info_cache[('2.0', 'L2_PHE_S')] = cube_info
+    assert client._as_cube_info(cube_info.to_frame()) is cube_info
@@ -0,0 +1,15 @@
+import threading
+
+from hkvwaporpy.fao_wapor_api import __fao_wapor_class as _fao_wapor_class
+
+
+def test_session_per_thread():
+    client = _fao_wapor_class()
+    session = client._session()
+    assert client._session() is session
+
+    sessions = []
+    thread = threading.Thread(target=lambda: sessions.append(client._session()))
+    thread.start()
+    thread.join()
+    assert sessions[0] is not session
@@ -0,0 +1,137 @@
+import datetime
+import os
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from hkvwaporpy import BulkPipeline
+from hkvwaporpy.journal import DOWNLOADED, FAILED, URL_RESOLVED, JOURNAL_FORMAT, JobJournal
+
+TIME_RANGE = '[2015-01-01,2016-12-31]'
+
+
+class FakeClient(object):
+    """
+    client without network access with one raster per month of 2015 and 2016. The
+    resolved URLs and downloads are recorded, downloads of the raster ids in fail raise
+    """
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.version = '2.0'
+        self._catalogus = None
+        self.availability = []
+        self.resolved = []
+        self.downloaded = []
+
+    def get_catalogus(self, version):
+        self.version = version
+        self._catalogus = pd.DataFrame()
+
+    def get_cube_info(self, cube_code):
+        return cube_code
+
+    def get_data_availability(self, cube_info, time_range):
+        self.availability.append(time_range)
+        start, end = time_range.strip('[]').split(',')
+        years = [str(year) for year in range(int(start[:4]), int(end[:4]) + 1)]
+        df = pd.DataFrame({
+            'year': [year for year in years for month in range(1, 13)],
+            'raster_id': ['L1_AETI_{0}{1:02d}'.format(year[2:], month) for year in years for month in range(1, 13)],
+            'bbox_srid': 'EPSG:4326',
+            'bbox_value': [[0, 0, 1, 1]] * 12 * len(years),
+        })
+        return df.set_index('year')
+
+    def get_coverage_url(self, APItoken, raster_id, cube_code, loc_type=None, loc_code=None):
+        self.resolved.append(raster_id)
+        return {'download_url': 'url_' + raster_id,
+                'expiry_datetime': datetime.datetime.now() + datetime.timedelta(hours=1)}
+
+    def download_coverage(self, download_url, filename):
+        if download_url[4:] in self.fail:
+            raise IOError('download of {} failed'.format(download_url))
+        self.downloaded.append(download_url)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, 'w') as f:
+            f.write(download_url)
+        return len(download_url)
+
+
+def run(folder, client, job_spec):
+    journal = JobJournal(os.path.join(folder, 'journal.sqlite'))
+    # without skip_existing, only the journal prevents downloading a raster twice
+    pipeline = BulkPipeline(client, 'token', os.path.join(folder, 'data'), n_download=2,
+                            journal=journal, skip_existing=False)
+    try:
+        df_report = pipeline.run(job_spec)
+        progress = journal.progress()
+    finally:
+        journal.close()
+    return df_report, progress
+
+
+def test_rerun_retries_failed_and_skips_downloaded(tmp_path):
+    folder = str(tmp_path)
+    job_spec = {'version': '2.0', 'cube_codes': ['L1_AETI_M'], 'time_range': TIME_RANGE}
+    failing = ['L1_AETI_1503', 'L1_AETI_1611']
+    df_report, progress = run(folder, FakeClient(fail=failing), job_spec)
+    assert sorted(df_report.loc[df_report['status'] == 'failed', 'raster_id']) == failing
+    assert progress[DOWNLOADED] == 22
+    assert progress[FAILED] == 2
+
+    client = FakeClient()
+    df_report, progress = run(folder, client, job_spec)
+    assert client.availability == []
+    assert sorted(client.downloaded) == ['url_' + raster_id for raster_id in failing]
+    assert sorted(df_report['raster_id']) == failing
+    assert progress[DOWNLOADED] == 24
+    assert progress[FAILED] == 0
+
+
+def test_rerun_with_years_finds_rasters_of_time_range(tmp_path):
+    folder = str(tmp_path)
+    failing = ['L1_AETI_1503', 'L1_AETI_1611']
+    run(folder, FakeClient(fail=failing),
+        {'version': '2.0', 'cube_codes': ['L1_AETI_M'], 'time_range': TIME_RANGE})
+
+    client = FakeClient()
+    df_report, progress = run(folder, client, {'version': '2.0', 'cube_codes': ['L1_AETI_M'], 'years': [2015, 2016]})
+    assert sorted(client.availability) == ['[2015-01-01,2015-12-31]', '[2016-01-01,2016-12-31]']
+    assert sorted(client.downloaded) == ['url_' + raster_id for raster_id in failing]
+    assert sum(progress.values()) == 24
+    assert progress[DOWNLOADED] == 24
+
+
+def test_unexpired_resolved_url_is_reused(tmp_path):
+    folder = str(tmp_path)
+    job_spec = {'version': '2.0', 'cube_codes': ['L1_AETI_M'], 'time_range': TIME_RANGE}
+    journal = JobJournal(os.path.join(folder, 'journal.sqlite'))
+    journal.add_availability(FakeClient().get_data_availability('L1_AETI_M', TIME_RANGE), '2.0',
+                             'L1_AETI_M', TIME_RANGE, [(None, None)])
+    now = datetime.datetime.now()
+    item = {'version': '2.0', 'cube_code': 'L1_AETI_M', 'loc_type': None, 'loc_code': None}
+    journal.set_state(dict(item, raster_id='L1_AETI_1501', download_url='cached_L1_AETI_1501',
+                           expiry_datetime=now + datetime.timedelta(hours=1)), URL_RESOLVED)
+    journal.set_state(dict(item, raster_id='L1_AETI_1502', download_url='cached_L1_AETI_1502',
+                           expiry_datetime=now - datetime.timedelta(hours=1)), URL_RESOLVED)
+    journal.close()
+
+    client = FakeClient()
+    df_report, progress = run(folder, client, job_spec)
+    assert 'L1_AETI_1501' not in client.resolved
+    assert 'L1_AETI_1502' in client.resolved
+    assert len(client.resolved) == 23
+    assert 'cached_L1_AETI_1501' in client.downloaded
+    assert 'cached_L1_AETI_1502' not in client.downloaded
+    assert progress[DOWNLOADED] == 24
+
+
+def test_old_journal_format_is_refused(tmp_path):
+    path = str(tmp_path / 'journal.sqlite')
+    JobJournal(path).close()
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA user_version={}'.format(JOURNAL_FORMAT - 1))
+    conn.close()
+    with pytest.raises(ValueError, match='Start a new journal file'):
+        JobJournal(path)
@@ -0,0 +1,164 @@
+import glob
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+
+import pandas as pd
+import pytest
+
+from hkvwaporpy import BulkPipeline, HashShard, LeaseShard
+
+N_RASTERS = 40
+JOB_SPEC = {'version': '2.0', 'cube_codes': ['L1_AETI_D'], 'time_range': '[2015-01-01,2016-01-01]'}
+
+
+class FakeClient(object):
+    """
+    client without network access, every download leaves a marker file so
+    duplicate downloads can be counted
+    """
+    def __init__(self, marker_folder, delay=0.01):
+        self.marker_folder = marker_folder
+        self.delay = delay
+        self.version = '2.0'
+        self._catalogus = None
+
+    def get_catalogus(self, version):
+        self.version = version
+        self._catalogus = pd.DataFrame()
+
+    def get_cube_info(self, cube_code):
+        return cube_code
+
+    def get_data_availability(self, cube_info, time_range):
+        return pd.DataFrame({'raster_id': ['L1_AETI_{:03d}'.format(i) for i in range(N_RASTERS)]})
+
+    def get_coverage_url(self, APItoken, raster_id, cube_code, loc_type=None, loc_code=None):
+        return {'download_url': raster_id, 'expiry_datetime': None}
+
+    def download_coverage(self, download_url, filename):
+        time.sleep(self.delay)
+        open(os.path.join(self.marker_folder, '{0}.{1}'.format(download_url, uuid.uuid4().hex)), 'w').close()
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, 'w') as f:
+            f.write(download_url)
+        return len(download_url)
+
+
+def _run_node(args):
+    folder, mode, node, n_nodes = args
+    if mode == 'lease':
+        shard = LeaseShard(os.path.join(folder, 'leases'), ttl=30, heartbeat=1, poll_interval=0.1)
+    else:
+        shard = HashShard(str(node), [str(i) for i in range(n_nodes)])
+    pipeline = BulkPipeline(FakeClient(os.path.join(folder, 'markers')), 'token',
+                            os.path.join(folder, 'data'), n_download=2, shard=shard)
+    try:
+        df_report = pipeline.run(JOB_SPEC)
+    finally:
+        shard.close()
+    return df_report['status'].value_counts().to_dict()
+
+
+def _markers(folder):
+    return [os.path.basename(path).split('.')[0] for path in glob.glob(os.path.join(folder, 'markers', '*'))]
+
+
+@pytest.mark.parametrize('mode', ['lease', 'hash'])
+def test_each_raster_downloaded_once(tmp_path, mode):
+    folder = str(tmp_path)
+    os.makedirs(os.path.join(folder, 'markers'))
+    n_nodes = 4
+    with multiprocessing.Pool(n_nodes) as pool:
+        results = pool.map(_run_node, [(folder, mode, node, n_nodes) for node in range(n_nodes)])
+
+    markers = _markers(folder)
+    assert len(markers) == N_RASTERS
+    assert len(set(markers)) == N_RASTERS
+    assert sum(result.get('downloaded', 0) for result in results) == N_RASTERS
+    for result in results:
+        assert sum(result.values()) == N_RASTERS
+    if mode == 'lease':
+        assert os.listdir(os.path.join(folder, 'leases')) == []
+
+
+def _pipeline(folder, shard, skip_existing=True):
+    os.makedirs(os.path.join(folder, 'markers'), exist_ok=True)
+    return BulkPipeline(FakeClient(os.path.join(folder, 'markers'), delay=0), 'token',
+                        os.path.join(folder, 'data'), shard=shard, skip_existing=skip_existing)
+
+
+def test_stale_lease_is_taken_over(tmp_path):
+    folder = str(tmp_path)
+    shard = LeaseShard(os.path.join(folder, 'leases'), node_id='alive', ttl=0.5, poll_interval=0.1)
+    # lease of a node that died without releasing it
+    dead = LeaseShard(os.path.join(folder, 'leases'), node_id='dead', ttl=0.5)
+    item = {'cube_code': 'L1_AETI_D', 'loc_code': None, 'raster_id': 'L1_AETI_000'}
+    assert dead.claim(item)
+    dead._stop.set()
+
+    df_report = _pipeline(folder, shard).run(JOB_SPEC)
+    shard.close()
+
+    assert (df_report['status'] == 'downloaded').all()
+    assert len(df_report) == N_RASTERS
+    assert sorted(_markers(folder)) == sorted(df_report['raster_id'])
+
+
+def test_released_lease_without_raster_is_taken_over(tmp_path):
+    folder = str(tmp_path)
+    shard = LeaseShard(os.path.join(folder, 'leases'), node_id='this', ttl=30, poll_interval=0.1)
+    # another node holds a lease and releases it after a failed download
+    other = LeaseShard(os.path.join(folder, 'leases'), node_id='other', ttl=30)
+    item = {'cube_code': 'L1_AETI_D', 'loc_code': None, 'raster_id': 'L1_AETI_000'}
+    assert other.claim(item)
+    timer = threading.Timer(0.5, other.release, args=(item,))
+    timer.start()
+
+    df_report = _pipeline(folder, shard).run(JOB_SPEC)
+    timer.join()
+    shard.close()
+    other.close()
+
+    assert (df_report['status'] == 'downloaded').all()
+    assert len(_markers(folder)) == N_RASTERS
+
+
+def test_existing_rasters_downloaded_again_without_skip_existing(tmp_path):
+    folder = str(tmp_path)
+    filename = os.path.join(folder, 'data', 'L1_AETI_D', 'L1', 'L1_AETI_000.tif')
+    os.makedirs(os.path.dirname(filename))
+    open(filename, 'w').close()
+    os.utime(filename, (time.time() - 3600, time.time() - 3600))
+
+    shard = LeaseShard(os.path.join(folder, 'leases'), ttl=30)
+    df_report = _pipeline(folder, shard, skip_existing=False).run(JOB_SPEC)
+    shard.close()
+
+    assert (df_report['status'] == 'downloaded').all()
+    assert len(_markers(folder)) == N_RASTERS
+
+
+def test_lease_taken_over_is_not_released_or_refreshed(tmp_path):
+    folder = os.path.join(str(tmp_path), 'leases')
+    item = {'cube_code': 'L1_AETI_D', 'loc_code': None, 'raster_id': 'L1_AETI_000'}
+    slow = LeaseShard(folder, node_id='slow', ttl=0.5, heartbeat=0.1)
+    assert slow.claim(item)
+    path = slow._lease_path(item)
+
+    # the lease is lost to another node, eg. while the lease was moved aside by a reclaim
+    other = LeaseShard(folder, node_id='other', ttl=0.5)
+    os.remove(path)
+    assert other.claim(item)
+    other._stop.set()
+    old = time.time() - 3600
+    os.utime(path, (old, old))
+    time.sleep(0.5)
+    assert os.stat(path).st_mtime == old
+    assert slow._held == {}
+
+    slow.release(item)
+    slow.close()
+    assert other._owns(path, other._held[path])